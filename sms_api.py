@@ -1,10 +1,22 @@
 #!/usr/bin/env python3
 import argparse
 import json
-from http.server import BaseHTTPRequestHandler, HTTPServer
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from urllib.parse import urlparse, parse_qs
 
-from sms_cli import load_history, prune_history, parse_ts
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+from sms_cli import load_history_cached, parse_ts
+
+
+if orjson is not None:
+    _dumps = orjson.dumps
+else:
+    def _dumps(obj):
+        return json.dumps(obj, ensure_ascii=False).encode("utf-8")
 
 
 def _filter_since(records, since_value):
@@ -13,7 +25,15 @@ def _filter_since(records, since_value):
     since = parse_ts(since_value)
     if not since:
         return records
-    return [r for r in records if parse_ts(r.get("ts")) and parse_ts(r.get("ts")) >= since]
+    # Historico e append-only em ordem cronologica (ver load_history):
+    # basta varrer do fim ate o primeiro registro anterior a `since`.
+    i = len(records)
+    while i > 0:
+        ts = parse_ts(records[i - 1].get("ts"))
+        if ts is None or ts < since:
+            break
+        i -= 1
+    return records[i:]
 
 
 def _apply_limit(records, limit_value):
@@ -28,34 +48,75 @@ def _apply_limit(records, limit_value):
     return records[-limit:]
 
 
+def _fetch(records, since, limit):
+    if not since:
+        # So o rabo interessa: fatia direto, sem passar pelo filtro.
+        return _apply_limit(records, limit)
+    return _apply_limit(_filter_since(records, since), limit)
+
+
+_STREAM_CHUNK = 64 * 1024
+
+
+def _raw_response(status, body):
+    head = (
+        f"HTTP/1.0 {status}\r\n"
+        "Content-Type: application/json; charset=utf-8\r\n"
+        "Cache-Control: no-store\r\n"
+        f"Content-Length: {len(body)}\r\n"
+        "\r\n"
+    )
+    return head.encode("ascii") + body
+
+
+# Respostas fixas montadas uma vez: /health vira um unico write no socket.
+_HEALTH_RESPONSE = _raw_response("200 OK", _dumps({"status": "ok"}))
+_NOT_FOUND_RESPONSE = _raw_response("404 Not Found", _dumps({"error": "not_found"}))
+
+
 class Handler(BaseHTTPRequestHandler):
-    def _send_json(self, code, payload):
-        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
-        self.send_response(code)
+    def _send_bytes(self, response):
+        self.wfile.write(response)
+
+    def _send_history(self, items):
+        # Sem Content-Length (HTTP/1.0): o corpo termina ao fechar a conexao,
+        # entao os registros sao serializados e enviados em blocos.
+        self.send_response(200)
         self.send_header("Content-Type", "application/json; charset=utf-8")
         self.send_header("Cache-Control", "no-store")
-        self.send_header("Content-Length", str(len(body)))
         self.end_headers()
-        self.wfile.write(body)
+        write = self.wfile.write
+        buf = [b'{"count":%d,"items":[' % len(items)]
+        size = 0
+        sep = b""
+        for rec in items:
+            chunk = _dumps(rec)
+            buf.append(sep)
+            buf.append(chunk)
+            sep = b","
+            size += len(chunk)
+            if size >= _STREAM_CHUNK:
+                write(b"".join(buf))
+                buf = []
+                size = 0
+        buf.append(b"]}")
+        write(b"".join(buf))
 
     def do_GET(self):
         parsed = urlparse(self.path)
         if parsed.path == "/health":
-            self._send_json(200, {"status": "ok"})
+            self._send_bytes(_HEALTH_RESPONSE)
             return
         if parsed.path != "/history":
-            self._send_json(404, {"error": "not_found"})
+            self._send_bytes(_NOT_FOUND_RESPONSE)
             return
 
         params = parse_qs(parsed.query)
         since = params.get("since", [""])[0]
         limit = params.get("limit", [""])[0]
 
-        records = prune_history(load_history())
-        records = _filter_since(records, since)
-        records = _apply_limit(records, limit)
-
-        self._send_json(200, {"count": len(records), "items": records})
+        records = load_history_cached()
+        self._send_history(_fetch(records, since, limit))
 
     def log_message(self, format, *args):
         return
@@ -67,7 +128,9 @@ def main():
     parser.add_argument("--port", type=int, default=8081, help="Port to bind")
     args = parser.parse_args()
 
-    httpd = HTTPServer((args.host, args.port), Handler)
+    # Uma thread por requisicao: leitura do historico e escrita na rede de um
+    # cliente nao bloqueiam os demais.
+    httpd = ThreadingHTTPServer((args.host, args.port), Handler)
     print(f"SMS history API listening on http://{args.host}:{args.port}")
     httpd.serve_forever()
 
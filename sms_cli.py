@@ -2,19 +2,31 @@
 try:
     import curses
 except Exception:
-    print("Erro: curses nao disponivel. No Windows, instale: pip install windows-curses")
-    raise SystemExit(1)
+    # So a TUI precisa do curses; o sms_api importa este modulo sem ele.
+    curses = None
+try:
+    import orjson
+except ImportError:
+    orjson = None
+import atexit
+import codecs
+import copy
+import importlib.util
+import io
 import json
-import locale
 import os
+import queue
 import re
 import subprocess
+import threading
 import time
 import random
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from datetime import timedelta
 from glob import glob
 import csv
+import functools
 import shutil
 import unicodedata
 
@@ -23,10 +35,54 @@ CONFIG_PATH = os.path.join(BASE_DIR, "config.json")
 GAMMU_RC_PATH = os.path.join(BASE_DIR, "gammurc")
 LOG_PATH = os.path.join(BASE_DIR, "sms_cli.log")
 HISTORY_PATH = os.path.join(BASE_DIR, "sms_history.jsonl")
+SMSD_DIR = os.path.join(BASE_DIR, "smsd")
+SMSD_SEND_TIMEOUT_SEC = 120
 HISTORY_RETENTION_DAYS = 7
+AUTO_ACTIVATE_POLL_SEC = 1.0
 VERSION = "linux-mint-artemis1"
 IS_WINDOWS = os.name == "nt"
 
+_RE_NON_DIGIT = re.compile(r"\D+")
+_RE_TOKEN_SPLIT = re.compile(r"[^0-9]+")
+_RE_NUM_CLEAN = re.compile(r"[^\d+]")
+# Remove tudo que nao e digito ASCII no intervalo Latin-1 (str.translate, sem regex).
+_DIGIT_TABLE = str.maketrans("", "", "".join(chr(c) for c in range(256) if not 48 <= c <= 57))
+# Idem, mantendo o "\n" (separador na limpeza em lote de format_numbers).
+_DIGIT_LINE_TABLE = str.maketrans("", "", "".join(chr(c) for c in range(256) if not (48 <= c <= 57 or c == 10)))
+# Idem, mantendo o "+" (numero proprio lido do chip).
+_NUM_TABLE = str.maketrans("", "", "".join(chr(c) for c in range(256) if not (48 <= c <= 57 or c == 43)))
+_RE_SECTION_SANITIZE = re.compile(r"[^A-Za-z0-9_]+")
+_RE_WMI_COM = re.compile(r"\((COM\d+)\)", re.IGNORECASE)
+_RE_WMI_VIDPID = re.compile(r"VID_([0-9A-F]{4}).*?PID_([0-9A-F]{4})", re.IGNORECASE)
+_RE_SMSD_WRITTEN = re.compile(r"Written message with ID (.+)")
+_RE_IDENTIFY_OK = re.compile(r"(?im)^\s*(IMEI|Manufacturer)\s*:")
+_RE_AT_SPLIT = re.compile(r"[;\n]+")
+_RE_IFACE = re.compile(r"-if(\d+)-port")
+_RE_BYPATH = re.compile(r"^(.*):1\.\d+-port\d+$")
+_RE_BYID = re.compile(r"^(.*)-if\d+-port\d+$")
+_RE_COM = re.compile(r"COM(\d+)")
+_RE_TTY_SERIAL = re.compile(r"tty(USB|ACM)\d+$")
+_RE_NAME_TAG = re.compile(r"<\s*name\s*>", re.IGNORECASE)
+_RE_NUMBER_LINE = re.compile(r"(?im)^number[^:\r\n]*:([^\r\n]*)")
+
+_JSON_DECODER = json.JSONDecoder()
+
+
+def _stdlib_json_loads(data):
+    # json.loads em bytes detecta o encoding a cada chamada; o historico e
+    # sempre UTF-8, entao decodifica direto e reusa um unico decoder.
+    if isinstance(data, (bytes, bytearray)):
+        data = data.decode("utf-8")
+    return _JSON_DECODER.decode(data)
+
+
+_json_loads = orjson.loads if orjson is not None else _stdlib_json_loads
+
+
+def _history_line(rec):
+    # Separadores compactos: ~10-15% menos bytes por registro no jsonl.
+    return json.dumps(rec, separators=(",", ":"), ensure_ascii=False).encode("utf-8") + b"\n"
+
 DEFAULT_CONFIG = {
     "country_prefix": "55",
     "flash": False,
@@ -45,10 +101,38 @@ DEFAULT_CONFIG = {
     "keepalive_enabled": True,
     "keepalive_interval_sec": 60,
     "keepalive_commands": "AT",
+    "smsd_enabled": False,
+    "gammu_bin_path": "",
+    "ui_max_fps": 30,
 }
 
 
+_CFG_CACHE = {"mtime": None, "data": None}
+
+
+def _config_mtime():
+    try:
+        return os.stat(CONFIG_PATH).st_mtime_ns
+    except OSError:
+        return None
+
+
 def load_config():
+    return copy.deepcopy(_cached_config())
+
+
+def _cached_config():
+    """Config do cache (somente leitura); relido so se o mtime mudar."""
+    mtime = _config_mtime()
+    if mtime is not None and mtime == _CFG_CACHE["mtime"]:
+        return _CFG_CACHE["data"]
+    cfg = _load_config_file()
+    _CFG_CACHE["mtime"] = _config_mtime()
+    _CFG_CACHE["data"] = copy.deepcopy(cfg)
+    return _CFG_CACHE["data"]
+
+
+def _load_config_file():
     if not os.path.exists(CONFIG_PATH):
         save_config(DEFAULT_CONFIG)
         return dict(DEFAULT_CONFIG)
@@ -109,14 +193,23 @@ def load_config():
 def save_config(cfg):
     with open(CONFIG_PATH, "w", encoding="utf-8") as f:
         json.dump(cfg, f, indent=2, ensure_ascii=False)
+    _CFG_CACHE["mtime"] = _config_mtime()
+    _CFG_CACHE["data"] = copy.deepcopy(cfg)
 
 def parse_at_commands(value):
     if not value:
         return []
-    parts = re.split(r"[;\n]+", str(value))
-    return [p.strip() for p in parts if p and p.strip()]
+    return list(_parse_at_commands_cached(str(value)))
+
+
+@functools.lru_cache(maxsize=8)
+def _parse_at_commands_cached(text):
+    # Os textos vem do config (init/keepalive) e se repetem a cada chamada.
+    return tuple(p.strip() for p in _RE_AT_SPLIT.split(text) if p and p.strip())
 
+@functools.lru_cache(maxsize=32)
 def summarize_at_commands(value, max_len=40):
+    # Os mesmos dois textos (init/keepalive) ate o usuario edita-los.
     cmds = parse_at_commands(value)
     if not cmds:
         return "vazio"
@@ -193,11 +286,32 @@ def device_real(dev):
         # COM ports não precisam de canonicalização; manter simples evita caminhos estranhos
         return str(dev).upper()
     try:
-        return os.path.realpath(dev)
+        return _realpath_cached(dev)
     except Exception:
         return dev
 
 
+@functools.lru_cache(maxsize=256)
+def _realpath_cached(dev):
+    # Limpo a cada scan_devices: o alvo dos links muda quando o modem e replugado.
+    return os.path.realpath(dev)
+
+
+def _list_dir(path, pattern=None):
+    """Caminhos (ordenados) das entradas de `path`, opcionalmente filtradas por nome."""
+    try:
+        with os.scandir(path) as it:
+            names = [
+                e.name
+                for e in it
+                if not e.name.startswith(".") and (pattern is None or pattern.match(e.name))
+            ]
+    except OSError:
+        return []
+    names.sort()
+    return [os.path.join(path, n) for n in names]
+
+
 def resolve_selected_devices(devices, selected_cfg):
     real_map = {device_real(d): d for d in devices}
     selected = []
@@ -207,13 +321,64 @@ def resolve_selected_devices(devices, selected_cfg):
             selected.append(real_map[real])
     return selected
 
-def list_windows_ports():
+def _wmi_port_entries():
+    """Portas COM via WMI; None se o modulo wmi nao estiver disponivel."""
+    try:
+        import wmi  # type: ignore
+    except Exception:
+        return None
+    try:
+        rows = wmi.WMI().query(
+            "SELECT DeviceID, Name, PNPDeviceID FROM Win32_PnPEntity WHERE Name LIKE '%(COM%'"
+        )
+    except Exception:
+        return None
+    entries = []
+    for row in rows:
+        name = row.Name or ""
+        m = _RE_WMI_COM.search(name)
+        if not m:
+            continue
+        pnp = row.PNPDeviceID or ""
+        # USB\VID_12D1&PID_1506&MI_02\7&2A5C2F4&0&0002: as interfaces do mesmo
+        # aparelho compartilham a instancia sem o ultimo campo.
+        parts = pnp.split("\\")
+        instance = parts[2].rsplit("&", 1)[0] if len(parts) > 2 else pnp
+        ids = _RE_WMI_VIDPID.search(pnp)
+        key = f"{ids.group(1)}:{ids.group(2)}:{instance}" if ids else instance
+        entries.append((m.group(1).upper(), name, key))
+    return entries
+
+
+def _pyserial_port_entries():
     try:
         from serial.tools import list_ports
     except Exception:
         return []
+    entries = []
+    for p in list_ports.comports():
+        if not p.device:
+            continue
+        loc = getattr(p, "location", None) or ""
+        loc_base = loc.rsplit(".", 1)[0] if "." in loc else loc
+        key = (
+            getattr(p, "serial_number", None)
+            or loc_base
+            or f"{getattr(p, 'vid', None)}:{getattr(p, 'pid', None)}"
+        )
+        entries.append((p.device, getattr(p, "description", ""), key))
+    return entries
+
+
+def list_windows_ports():
+    # WMI filtrado por "(COM" evita o comports(), que trava segundos por porta
+    # Bluetooth SPP; pyserial fica como alternativa.
+    entries = _wmi_port_entries()
+    if entries is None:
+        entries = _pyserial_port_entries()
+
     def _com_number(dev):
-        m = re.search(r"COM(\\d+)", str(dev).upper())
+        m = _RE_COM.search(str(dev).upper())
         return int(m.group(1)) if m else 10_000
 
     def _pref_score(desc):
@@ -227,28 +392,19 @@ def list_windows_ports():
         return 2
 
     ports_by_key = {}
-    for p in list_ports.comports():
-        if not p.device:
-            continue
-        loc = getattr(p, "location", None) or ""
-        loc_base = loc.rsplit(".", 1)[0] if "." in loc else loc
-        key = (
-            getattr(p, "serial_number", None)
-            or loc_base
-            or f"{getattr(p, 'vid', None)}:{getattr(p, 'pid', None)}"
-        )
-        score = _pref_score(getattr(p, "description", ""))
+    for device, desc, key in entries:
+        score = _pref_score(desc)
         existing = ports_by_key.get(key)
         if existing is None or score < existing[0] or (
-            score == existing[0] and _com_number(p.device) < _com_number(existing[1])
+            score == existing[0] and _com_number(device) < _com_number(existing[1])
         ):
-            ports_by_key[key] = (score, p.device)
+            ports_by_key[key] = (score, device)
     ports = [dev for _, dev in sorted(ports_by_key.values(), key=lambda t: _com_number(t[1]))]
     return ports
 
 
 def _iface_rank(dev):
-    m = re.search(r"-if(\d+)-port", dev)
+    m = _RE_IFACE.search(dev)
     if not m:
         return (1, dev)
     try:
@@ -260,8 +416,9 @@ def _iface_rank(dev):
 def scan_devices(prefer_devices=None):
     if IS_WINDOWS:
         return list_windows_ports()
+    _realpath_cached.cache_clear()
     prefer_set = set(prefer_devices or [])
-    by_path = sorted(glob("/dev/serial/by-path/*"))
+    by_path = _list_dir("/dev/serial/by-path")
     if by_path:
         # Prefer non-usbv2 entries to avoid duplicates.
         filtered = [d for d in by_path if "usbv2-" not in d]
@@ -269,7 +426,7 @@ def scan_devices(prefer_devices=None):
             filtered = by_path
         groups = {}
         for dev in filtered:
-            m = re.match(r"^(.*):1\.\d+-port\d+$", dev)
+            m = _RE_BYPATH.match(dev)
             key = m.group(1) if m else dev
             groups.setdefault(key, []).append(dev)
         devices = []
@@ -287,19 +444,12 @@ def scan_devices(prefer_devices=None):
             devices.append(chosen)
         return devices
 
-    patterns = [
-        "/dev/serial/by-id/*",
-        "/dev/ttyUSB*",
-        "/dev/ttyACM*",
-    ]
-    candidates = []
-    for p in patterns:
-        candidates.extend(sorted(glob(p)))
-    by_id = [d for d in candidates if d.startswith("/dev/serial/by-id/")]
-    others = [d for d in candidates if d not in by_id]
+    by_id = _list_dir("/dev/serial/by-id")
+    # Uma unica passada em /dev para ttyUSB* e ttyACM*.
+    others = _list_dir("/dev", _RE_TTY_SERIAL)
     groups = {}
     for dev in by_id:
-        m = re.match(r"^(.*)-if\d+-port\d+$", dev)
+        m = _RE_BYID.match(dev)
         key = m.group(1) if m else dev
         groups.setdefault(key, []).append(dev)
     devices = []
@@ -315,7 +465,7 @@ def scan_devices(prefer_devices=None):
             continue
         seen_real.add(real)
         devices.append(chosen)
-    for dev in sorted(others):
+    for dev in others:
         real = device_real(dev)
         if real in seen_real:
             continue
@@ -324,153 +474,580 @@ def scan_devices(prefer_devices=None):
     return devices
 
 
+# Conteudo ja gravado por caminho: config igual ao anterior nao e regravado.
+_CFG_WRITTEN = {}
+
+
+def _write_config_bytes(path, data):
+    if _CFG_WRITTEN.get(path) == data and os.path.exists(path):
+        return
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, "O_BINARY", 0), 0o644)
+    try:
+        view = memoryview(data)
+        while view:
+            view = view[os.write(fd, view):]
+    finally:
+        os.close(fd)
+    _CFG_WRITTEN[path] = data
+
+
+_SCAN_CACHE = {"sig": None, "devs": None}
+
+
+def _scan_signature():
+    # Criar/remover um device (ou refazer os links do udev) muda o mtime do
+    # diretorio; um stat por diretorio substitui o scan completo.
+    sig = []
+    for path in ("/dev", "/dev/serial/by-id", "/dev/serial/by-path"):
+        try:
+            sig.append(os.stat(path).st_mtime_ns)
+        except OSError:
+            sig.append(None)
+    return tuple(sig)
+
+
+def scan_devices_cached():
+    """scan_devices() reaproveitado enquanto /dev e /dev/serial nao mudarem."""
+    if IS_WINDOWS:
+        return scan_devices()
+    sig = _scan_signature()
+    if sig == _SCAN_CACHE["sig"]:
+        return list(_SCAN_CACHE["devs"])
+    devs = scan_devices()
+    _SCAN_CACHE.update(sig=sig, devs=list(devs))
+    return devs
+
+
 def write_gammu_config(devices, connection):
-    lines = []
-    for i, dev in enumerate(devices, start=1):
-        section = f"gammu{i}"
-        lines.append(f"[{section}]")
-        lines.append(f"port = {dev}")
-        lines.append(f"connection = {connection}")
-        lines.append("")
-    with open(GAMMU_RC_PATH, "w", encoding="utf-8") as f:
-        f.write("\n".join(lines))
+    data = "".join(
+        f"[gammu{i}]\nport = {dev}\nconnection = {connection}\n\n"
+        for i, dev in enumerate(devices, start=1)
+    ).encode("utf-8")
+    _write_config_bytes(GAMMU_RC_PATH, data)
+
+
+@functools.lru_cache(maxsize=128)
+def section_name_for_device(dev):
+    name = _RE_SECTION_SANITIZE.sub("_", str(dev)).strip("_")
+    return name or "dev"
 
 
 def write_temp_gammu_config(dev, connection):
-    section = "gammu1"
-    lines = [
-        f"[{section}]",
-        f"port = {dev}",
-        f"connection = {connection}",
-        "",
-    ]
-    path = os.path.join(BASE_DIR, "gammurc_check")
-    with open(path, "w", encoding="utf-8") as f:
-        f.write("\n".join(lines))
+    # Um arquivo por device: as sondagens rodam em paralelo.
+    path = os.path.join(BASE_DIR, f"gammurc_check_{section_name_for_device(dev)}")
+    _write_config_bytes(path, f"[gammu1]\nport = {dev}\nconnection = {connection}\n".encode("utf-8"))
     return path, "1"
 
 
-def parse_ts(value):
-    if not value:
-        return None
+@functools.lru_cache(maxsize=4096)
+def _parse_ts_cached(value):
     try:
         return datetime.fromisoformat(value)
     except Exception:
         return None
 
 
-def load_history():
-    records = []
-    if not os.path.exists(HISTORY_PATH):
-        return records
+def parse_ts(value):
+    # Registros do mesmo segundo repetem o ts; o cache evita reparsear.
+    if not value or not isinstance(value, str):
+        return None
+    return _parse_ts_cached(value)
+
+
+def iter_history():
+    """Percorre o historico na ordem do arquivo, sem montar a lista.
+
+    Os registros sao sempre anexados com o ts do momento da escrita (e a poda
+    preserva a ordem), entao saem em ordem cronologica.
+    """
+    flush_history()
     try:
-        with open(HISTORY_PATH, "r", encoding="utf-8") as f:
+        with open(HISTORY_PATH, "rb") as f:
             for line in f:
-                line = line.strip()
-                if not line:
+                if not line.strip():
                     continue
                 try:
-                    rec = json.loads(line)
+                    yield _json_loads(line)
                 except Exception:
                     continue
-                records.append(rec)
-    except Exception:
-        return []
-    return records
+    except OSError:
+        return
+
+
+def load_history():
+    return list(iter_history())
+
+
+_NOW_ISO = [(0, "")]
+
+
+def _now_iso():
+    # ts dos registros: mesmo segundo, mesma string (monta so na virada).
+    sec = int(time.time())
+    cached = _NOW_ISO[0]
+    if cached[0] != sec:
+        cached = (sec, datetime.fromtimestamp(sec).isoformat(timespec="seconds"))
+        _NOW_ISO[0] = cached
+    return cached[1]
+
+
+def _ts_in_window(value, cutoff, cutoff_iso):
+    # ts gravado por isoformat(timespec="seconds") compara como string, sem
+    # montar datetime; outros formatos passam pelo parse_ts.
+    if isinstance(value, str) and len(value) == 19 and value[10:11] == "T":
+        return value >= cutoff_iso
+    ts = parse_ts(value)
+    return bool(ts and ts >= cutoff)
 
 
 def prune_history(records=None, max_days=HISTORY_RETENTION_DAYS):
-    if records is None:
-        records = load_history()
     cutoff = datetime.now() - timedelta(days=max_days)
+    cutoff_iso = cutoff.isoformat(timespec="seconds")
+    if records is not None:
+        kept = [rec for rec in records if _ts_in_window(rec.get("ts"), cutoff, cutoff_iso)]
+        if len(kept) == len(records):
+            return kept
+        tmp = HISTORY_PATH + ".tmp"
+        try:
+            with open(tmp, "wb") as f:
+                f.write(b"".join(_history_line(rec) for rec in kept))
+            os.replace(tmp, HISTORY_PATH)
+        except Exception:
+            return kept
+        return kept
+
+    # Arquivo em ordem cronologica: tudo antes do primeiro registro dentro da
+    # janela expirou. Se ele ja esta no inicio, nao ha o que reescrever; senao
+    # so a cauda e copiada, byte a byte.
+    flush_history()
     kept = []
-    for rec in records:
-        ts = parse_ts(rec.get("ts"))
-        if ts and ts >= cutoff:
-            kept.append(rec)
-    tmp = HISTORY_PATH + ".tmp"
+    first_kept_offset = None
     try:
-        with open(tmp, "w", encoding="utf-8") as f:
-            for rec in kept:
-                f.write(json.dumps(rec, ensure_ascii=False) + "\n")
+        with open(HISTORY_PATH, "rb") as f:
+            offset = 0
+            for line in f:
+                start = offset
+                offset += len(line)
+                if not line.strip():
+                    continue
+                try:
+                    rec = _json_loads(line)
+                except Exception:
+                    continue
+                if not _ts_in_window(rec.get("ts"), cutoff, cutoff_iso):
+                    continue
+                if first_kept_offset is None:
+                    first_kept_offset = start
+                kept.append(rec)
+            if first_kept_offset is None:
+                first_kept_offset = offset
+            if first_kept_offset == 0:
+                return kept
+            tmp = HISTORY_PATH + ".tmp"
+            try:
+                f.seek(first_kept_offset)
+                with open(tmp, "wb") as out:
+                    shutil.copyfileobj(f, out)
+            except Exception:
+                return kept
         os.replace(tmp, HISTORY_PATH)
     except Exception:
         return kept
     return kept
 
 
-def append_history(record):
+_HISTORY_CACHE = {"key": None, "data": None, "ino": None, "offset": 0, "head": b""}
+HISTORY_HEAD_BYTES = 256
+_HISTORY_CACHE_LOCK = threading.Lock()
+
+
+def _history_stat():
+    try:
+        return os.stat(HISTORY_PATH)
+    except OSError:
+        return None
+
+
+def _stat_key(st):
+    if st is None:
+        return None
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+
+def _history_head():
+    try:
+        with open(HISTORY_PATH, "rb") as f:
+            return f.read(HISTORY_HEAD_BYTES)
+    except OSError:
+        return b""
+
+
+def _read_history_tail(offset, cutoff, head=b""):
+    """Registros completos a partir de `offset`; retorna (registros, novo offset).
+
+    (None, 0) se o arquivo nao for mais o mesmo (inicio diferente ou offset
+    fora de um fim de linha): o inode de um prune pode ser reaproveitado.
+    """
+    with open(HISTORY_PATH, "rb") as f:
+        if f.read(len(head)) != head:
+            return None, 0
+        if offset > 0:
+            f.seek(offset - 1)
+            if f.read(1) != b"\n":
+                return None, 0
+        f.seek(offset)
+        data = f.read()
+    end = data.rfind(b"\n") + 1
+    cutoff_iso = cutoff.isoformat(timespec="seconds")
+    records = []
+    for line in data[:end].splitlines():
+        if not line.strip():
+            continue
+        try:
+            rec = _json_loads(line)
+        except Exception:
+            continue
+        if _ts_in_window(rec.get("ts"), cutoff, cutoff_iso):
+            records.append(rec)
+    return records, offset + end
+
+
+def _drop_expired(records, cutoff):
+    """Descarta do inicio o que expirou (lista em ordem cronologica)."""
+    cutoff_iso = cutoff.isoformat(timespec="seconds")
+    start = 0
+    while start < len(records):
+        if _ts_in_window(records[start].get("ts"), cutoff, cutoff_iso):
+            break
+        start += 1
+    return records[start:] if start else records
+
+
+def load_history_cached():
+    """Historico ja podado, reaproveitado enquanto o arquivo nao mudar.
+
+    Se o arquivo so cresceu (mesmo inode), apenas as linhas novas sao lidas.
+    A lista retornada e compartilhada entre chamadas: nao modificar.
+    """
+    flush_history()
+    with _HISTORY_CACHE_LOCK:
+        st = _history_stat()
+        key = _stat_key(st)
+        cached = _HISTORY_CACHE["data"]
+        cutoff = datetime.now() - timedelta(days=HISTORY_RETENTION_DAYS)
+        if key is not None and key == _HISTORY_CACHE["key"]:
+            # Arquivo parado (ex.: sms_api ocioso): a janela de retencao
+            # continua andando, entao o que expirou sai do cache tambem.
+            data = _drop_expired(cached, cutoff)
+            if data is not cached:
+                _HISTORY_CACHE["data"] = data
+            return data
+        if (
+            st is not None
+            and cached is not None
+            and st.st_ino == _HISTORY_CACHE["ino"]
+            and st.st_size >= _HISTORY_CACHE["offset"]
+        ):
+            try:
+                new, offset = _read_history_tail(
+                    _HISTORY_CACHE["offset"], cutoff, _HISTORY_CACHE["head"]
+                )
+            except Exception:
+                new, offset = None, 0
+            if new is not None:
+                data = _drop_expired(cached, cutoff) + new
+                _HISTORY_CACHE.update(key=key, data=data, offset=offset)
+                return data
+        data = prune_history()
+        # prune_history reescreve o arquivo; a chave vale para o conteudo podado.
+        st = _history_stat()
+        _HISTORY_CACHE.update(
+            key=_stat_key(st),
+            data=data,
+            ino=st.st_ino if st is not None else None,
+            offset=st.st_size if st is not None else 0,
+            head=_history_head(),
+        )
+        return data
+
+
+HISTORY_FLUSH_RECORDS = 64
+HISTORY_FLUSH_SEC = 1.0
+_HIST_BUFFER = []
+_HIST_LOCK = threading.Lock()
+_HIST_LAST_FLUSH = [time.monotonic()]
+
+
+def _flush_history_locked():
+    _HIST_LAST_FLUSH[0] = time.monotonic()
+    if not _HIST_BUFFER:
+        return
+    data = b"".join(_HIST_BUFFER)
+    _HIST_BUFFER.clear()
     try:
-        with open(HISTORY_PATH, "a", encoding="utf-8") as f:
-            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        with open(HISTORY_PATH, "ab") as f:
+            f.write(data)
     except Exception:
         return
 
 
+def flush_history():
+    with _HIST_LOCK:
+        _flush_history_locked()
+
+
+atexit.register(flush_history)
+
+
+def append_history(record):
+    # Acumula as linhas e grava em lote (64 registros ou 1s); quem le o
+    # arquivo chama flush_history antes.
+    line = _history_line(record)
+    with _HIST_LOCK:
+        _HIST_BUFFER.append(line)
+        if (
+            len(_HIST_BUFFER) >= HISTORY_FLUSH_RECORDS
+            or time.monotonic() - _HIST_LAST_FLUSH[0] >= HISTORY_FLUSH_SEC
+        ):
+            _flush_history_locked()
+
+
+@functools.lru_cache(maxsize=1)
+def _has_pyserial():
+    return importlib.util.find_spec("serial") is not None
+
+
+def _at_probe(dev):
+    """AT direto pela serial (sem subprocesso); None se pyserial nao existir."""
+    if not _has_pyserial():
+        return None
+    baud = _cached_config().get("init_at_baud", 115200)
+    ok, resp = run_at_commands(dev, ["AT"], baud=baud, timeout=0.5)
+    return ok and "OK" in (resp or "").upper()
+
+
 def is_valid_modem(dev, connection):
+    # Modem que responde OK ao AT ja vale; sem resposta (baud diferente, porta
+    # de diagnostico...) a decisao fica com o gammu identify.
+    if str(connection or "").lower().startswith("at") and _at_probe(dev):
+        return True
     gbin = gammu_bin()
     if not gbin:
         return False
     try:
         cfg, section = write_temp_gammu_config(dev, connection)
         cmd = [gbin, "-c", cfg, "-s", section, "identify"]
-        proc = subprocess.run(cmd, capture_output=True, text=True, timeout=3)
+        proc = subprocess.run(
+            cmd,
+            capture_output=True,
+            text=True,
+            timeout=3,
+            env=dict(os.environ, LC_ALL="C"),
+        )
         return proc.returncode == 0
     except Exception:
         return False
 
 
-def get_own_number(dev, connection):
+def _parse_own_number(output):
+    for m in _RE_NUMBER_LINE.finditer(output or ""):
+        val = m.group(1).translate(_NUM_TABLE)
+        if not val.isascii():
+            val = _RE_NUM_CLEAN.sub("", val)
+        if val.strip("+"):
+            return val
+    return None
+
+
+def _probe_modem(dev, connection):
+    """identify + getmemory numa unica execucao do gammu (modo batch)."""
     gbin = gammu_bin()
     if not gbin:
-        return None
+        return False, None
     try:
         cfg, section = write_temp_gammu_config(dev, connection)
-        cmd = [gbin, "-c", cfg, "-s", section, "getmemory", "ON", "1", "20", "-nonempty"]
-        proc = subprocess.run(cmd, capture_output=True, text=True, timeout=3)
-        if proc.returncode != 0:
-            return None
-        for line in (proc.stdout or "").splitlines():
-            if line.lower().startswith("number"):
-                parts = line.split(":", 1)
-                if len(parts) != 2:
-                    continue
-                raw = parts[1].strip()
-                val = re.sub(r"[^\d+]", "", raw)
-                if val.strip("+"):
-                    return val
-        return None
+        cmd = [gbin, "-c", cfg, "-s", section, "batch"]
+        proc = subprocess.run(
+            cmd,
+            input="identify\ngetmemory ON 1 20 -nonempty\n",
+            capture_output=True,
+            text=True,
+            timeout=6,
+            # Saida em ingles: os marcadores abaixo nao sao traduzidos.
+            env=dict(os.environ, LC_ALL="C"),
+        )
+        out = proc.stdout or ""
+        if not _RE_IDENTIFY_OK.search(out):
+            return False, None
+        return True, _parse_own_number(out)
     except Exception:
-        return None
+        return False, None
+
+
+def _probe_device(dev, connection, read_numbers):
+    if read_numbers:
+        ok, number = _probe_modem(dev, connection)
+        return dev, "OK" if ok else "FAIL", number or "-"
+    ok = is_valid_modem(dev, connection)
+    return dev, "OK" if ok else "FAIL", "-"
+
+
+_LAST_SCAN = {"key": None, "ts": 0.0, "result": None}
+SCAN_REUSE_SEC = 1.0
 
 
 def scan_devices_with_status(connection, validate=True, read_numbers=False, prefer_devices=None):
     devices = scan_devices(prefer_devices=prefer_devices)
+    # Rescans em sequencia (ex.: auto-rescan logo apos um manual) reaproveitam
+    # a sondagem anterior se os devices e opcoes forem os mesmos.
+    key = (tuple(devices), connection, bool(validate), bool(read_numbers))
+    cached = _LAST_SCAN["result"]
+    if (
+        cached is not None
+        and _LAST_SCAN["key"] == key
+        and time.monotonic() - _LAST_SCAN["ts"] < SCAN_REUSE_SEC
+    ):
+        return list(cached[0]), dict(cached[1]), dict(cached[2])
+    t0 = time.monotonic()
+    devices, status, numbers = _probe_devices(devices, connection, validate, read_numbers)
+    if validate and devices:
+        record_cost("probe", time.monotonic() - t0)
+    _LAST_SCAN.update(key=key, ts=time.monotonic(), result=(devices, status, numbers))
+    return list(devices), dict(status), dict(numbers)
+
+
+# Media movel (EMA) do custo observado da sondagem e do tick do menu; em
+# maquinas/hubs lentos os intervalos automaticos crescem junto.
+_COST_EMA = {"probe": None, "tick": None}
+
+
+def record_cost(name, seconds):
+    prev = _COST_EMA[name]
+    _COST_EMA[name] = seconds if prev is None else 0.9 * prev + 0.1 * seconds
+
+
+def paced_interval(base, name, factor=10):
+    """Intervalo base, esticado para no minimo factor x o custo medio."""
+    cost = _COST_EMA[name]
+    if cost is None:
+        return base
+    return max(base, factor * cost)
+
+
+_MENU_SCAN = {"key": None, "ts": 0.0, "result": None}
+MENU_SCAN_TTL_SEC = 10.0
+
+
+def scan_options(cfg):
+    """(connection, validate, read_numbers, selecionados) lidos uma vez do cfg."""
+    return (
+        cfg.get("connection", "at"),
+        bool(cfg.get("validate_modems", True)),
+        bool(cfg.get("read_numbers", False)),
+        tuple(cfg.get("selected_devices", [])),
+    )
+
+
+def scan_devices_for_menu(opts):
+    # Voltar ao menu principal (ex.: depois do historico) nao sonda os modems
+    # de novo: so apos o TTL, se o /dev mudar ou depois de invalidate_menu_scan.
+    key = opts + (_scan_signature(),)
+    cached = _MENU_SCAN["result"]
+    if (
+        cached is not None
+        and _MENU_SCAN["key"] == key
+        and time.monotonic() - _MENU_SCAN["ts"] < MENU_SCAN_TTL_SEC
+    ):
+        return list(cached[0]), dict(cached[1]), dict(cached[2])
+    connection, validate, read_numbers, selected = opts
+    devices, status, numbers = scan_devices_with_status(
+        connection, validate, read_numbers, prefer_devices=list(selected)
+    )
+    _MENU_SCAN.update(key=key, ts=time.monotonic(), result=(devices, status, numbers))
+    return list(devices), dict(status), dict(numbers)
+
+
+def invalidate_menu_scan():
+    _MENU_SCAN["result"] = None
+
+
+def _probe_devices(devices, connection, validate, read_numbers):
     status = {}
     numbers = {}
-    for dev in devices:
-        if not validate:
+    if not validate or not devices:
+        for dev in devices:
             status[dev] = "?"
             numbers[dev] = "-"
-            continue
-        ok = is_valid_modem(dev, connection)
-        status[dev] = "OK" if ok else "FAIL"
-        if read_numbers and ok:
-            numbers[dev] = get_own_number(dev, connection) or "-"
-        else:
-            numbers[dev] = "-"
+        return devices, status, numbers
+    gammu_bin()
+    # Cada sondagem e um subprocesso do gammu com timeout proprio; em paralelo
+    # o scan leva o tempo do modem mais lento, nao a soma de todos.
+    with ThreadPoolExecutor(max_workers=min(16, len(devices))) as ex:
+        results = ex.map(lambda d: _probe_device(d, connection, read_numbers), devices)
+        for dev, st, num in results:
+            status[dev] = st
+            numbers[dev] = num
     return devices, status, numbers
 
 
+_LOG_FH = None
+_LOG_LOCK = threading.Lock()
+_LOG_LAST_SEC = [0, ""]
+
+
 def log_event(message):
-    ts = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    line = f"[{ts}] {message}\n"
-    with open(LOG_PATH, "a", encoding="utf-8") as f:
-        f.write(line)
+    global _LOG_FH
+    with _LOG_LOCK:
+        # Linhas do mesmo segundo reutilizam o timestamp ja formatado.
+        sec = int(time.time())
+        if sec != _LOG_LAST_SEC[0]:
+            _LOG_LAST_SEC[0] = sec
+            _LOG_LAST_SEC[1] = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(sec))
+        line = f"[{_LOG_LAST_SEC[1]}] {message}\n"
+        if _LOG_FH is None:
+            _LOG_FH = open(LOG_PATH, "a", encoding="utf-8", buffering=8192)
+        _LOG_FH.write(line)
+
+
+def flush_log():
+    with _LOG_LOCK:
+        if _LOG_FH is not None:
+            _LOG_FH.flush()
+
+
+def _close_log():
+    global _LOG_FH
+    with _LOG_LOCK:
+        if _LOG_FH is not None:
+            _LOG_FH.close()
+            _LOG_FH = None
+
+
+atexit.register(_close_log)
 
 
 def format_number(raw, prefix):
-    digits = re.sub(r"\D+", "", raw or "")
+    digits = (raw or "").translate(_DIGIT_TABLE)
+    if not digits.isascii():
+        # Sobrou algo fora do Latin-1; a regex trata digitos Unicode.
+        digits = _RE_NON_DIGIT.sub("", digits)
+    return _format_digits(digits, prefix)
+
+
+def format_numbers(raws, prefix):
+    """format_number em lote: uma unica passada de translate sobre todos os valores."""
+    raws = [raw or "" for raw in raws]
+    blob = "\n".join(raws)
+    if blob.count("\n") != len(raws) - 1:
+        # Algum valor tem quebra de linha propria: separa item a item.
+        return [format_number(raw, prefix) for raw in raws]
+    digits = blob.translate(_DIGIT_LINE_TABLE)
+    if not digits.isascii():
+        return [format_number(raw, prefix) for raw in raws]
+    return [_format_digits(d, prefix) for d in digits.split("\n")] if raws else []
+
+
+def _format_digits(digits, prefix):
     if not digits:
         return ""
     if prefix:
@@ -481,20 +1058,12 @@ def format_number(raw, prefix):
 
 
 def parse_numbers(text, prefix):
-    tokens = re.split(r"[^0-9]+", text or "")
-    seen = set()
-    numbers = []
-    for t in tokens:
-        if not t:
-            continue
-        if len(t) < 8:
-            continue
-        num = format_number(t, prefix)
-        if not num or num in seen:
-            continue
-        seen.add(num)
-        numbers.append({"number": num, "name": ""})
-    return numbers
+    # O split ja deixou so digitos: formata sem limpar de novo. dict.fromkeys
+    # deduplica mantendo a ordem (antes nos tokens brutos, depois formatados).
+    tokens = dict.fromkeys(_RE_TOKEN_SPLIT.split(text or ""))
+    formatted = dict.fromkeys(_format_digits(t, prefix) for t in tokens if len(t) >= 8)
+    formatted.pop("", None)
+    return [{"number": num, "name": ""} for num in formatted]
 
 
 def _normalize_text(value):
@@ -507,10 +1076,15 @@ _GAMMU_BIN = None
 
 
 def gammu_bin():
-    """Resolve o caminho do executavel do Gammu (cacheado)."""
+    """Resolve o caminho do executavel do Gammu (cacheado e salvo no config)."""
     global _GAMMU_BIN
     if _GAMMU_BIN is not None:
         return _GAMMU_BIN or None
+    cfg = load_config()
+    saved = cfg.get("gammu_bin_path") or ""
+    if saved and os.path.exists(saved):
+        _GAMMU_BIN = saved
+        return saved
     candidates = [shutil.which("gammu")]
     if IS_WINDOWS:
         pf = os.environ.get("ProgramFiles", r"C:\\Program Files")
@@ -524,50 +1098,206 @@ def gammu_bin():
     for path in candidates:
         if path and os.path.exists(path):
             _GAMMU_BIN = path
+            if path != saved:
+                cfg["gammu_bin_path"] = path
+                save_config(cfg)
             return path
     _GAMMU_BIN = ""
     return None
 
 
+def reset_gammu_bin():
+    """Esquece o caminho resolvido; a proxima chamada refaz a busca."""
+    global _GAMMU_BIN
+    _GAMMU_BIN = None
+
+
+def _detect_csv_encoding(head):
+    if head.startswith(codecs.BOM_UTF8):
+        return "utf-8-sig"
+    if head.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        return "utf-16"
+    if b"\x00" in head:
+        # UTF-16 sem BOM: os zeros ficam quase todos na posicao par (BE) ou
+        # impar (LE). Um NUL solto no meio de um CSV comum nao conta.
+        even = head[0::2].count(0)
+        odd = head[1::2].count(0)
+        half = max(len(head) // 2, 1)
+        if odd * 3 >= half and odd > 2 * even:
+            return "utf-16-le"
+        if even * 3 >= half and even > 2 * odd:
+            return "utf-16-be"
+    try:
+        head.decode("utf-8")
+        return "utf-8"
+    except UnicodeDecodeError as exc:
+        # Corte no meio de um caractere multibyte no fim da amostra ainda e UTF-8.
+        if exc.start >= len(head) - 3 and exc.reason == "unexpected end of data":
+            return "utf-8"
+        return "cp1252"
+
+
 def parse_csv_numbers(path, prefix):
-    encodings = ["utf-8-sig", "latin1", "cp1252", "utf-16", "utf-16le", "utf-16be"]
-    delimiters = ";,"
-    for enc in encodings:
-        numbers = []
-        seen = set()
+    try:
+        with open(path, "rb") as f:
+            raw = f.read()
+    except OSError:
+        return []
+    # Encoding provavel decidido pela amostra (BOM / primeiros 4 KB); se ele
+    # nao decodificar, der erro de CSV ou nao render nenhum numero, tenta o
+    # proximo. latin1 decodifica qualquer byte e fica por ultimo.
+    detected = _detect_csv_encoding(raw[:4096])
+    for enc in dict.fromkeys((detected, "utf-8", "cp1252", "latin1")):
         try:
-            with open(path, "r", encoding=enc) as f:
-                sample = f.read(4096)
-                f.seek(0)
-                try:
-                    dialect = csv.Sniffer().sniff(sample, delimiters=delimiters)
-                except Exception:
-                    dialect = csv.excel
-                reader = csv.reader(f, dialect=dialect)
-                for row in reader:
-                    if not row:
-                        continue
-                    num = row[0] if len(row) > 0 else ""
-                    name = _normalize_text(row[1] if len(row) > 1 else "")
-                    if not num:
-                        continue
-                    formatted = format_number(str(num), prefix)
-                    if formatted and formatted not in seen:
-                        seen.add(formatted)
-                        numbers.append(
-                            {
-                                "number": formatted,
-                                "name": str(name).strip() if name is not None else "",
-                            }
-                        )
-            if numbers:
-                return numbers
-        except Exception:
+            text = raw.decode(enc)
+        except UnicodeError:
+            continue
+        try:
+            numbers = _parse_csv_text(text, prefix)
+        except csv.Error:
             continue
+        if numbers:
+            return numbers
     return []
 
 
+def _parse_csv_text(text, prefix):
+    # Mesmas quebras de linha que a leitura em modo texto (\r\n e \r viram
+    # \n): o Sniffer e os campos com quebra entre aspas dependem disso.
+    if "\r" in text:
+        text = text.replace("\r\n", "\n").replace("\r", "\n")
+    try:
+        dialect = csv.Sniffer().sniff(text[:4096], delimiters=";,")
+    except Exception:
+        dialect = csv.excel
+    rows = [
+        row
+        for row in csv.reader(io.StringIO(text, newline=""), dialect=dialect)
+        if row and row[0]
+    ]
+    # Cada valor bruto distinto e formatado uma vez, todos numa passada so.
+    raws = list(dict.fromkeys(row[0] for row in rows))
+    formatted_by_raw = dict(zip(raws, format_numbers(raws, prefix)))
+    numbers = []
+    seen = set()
+    seen_add = seen.add
+    append = numbers.append
+    for row in rows:
+        formatted = formatted_by_raw[row[0]]
+        if formatted and formatted not in seen:
+            seen_add(formatted)
+            name = _normalize_text(row[1]) if len(row) > 1 else ""
+            append({"number": formatted, "name": name.strip()})
+    return numbers
+
+_SMSD = {}
+
+
+def _gammu_tool(name):
+    path = shutil.which(name)
+    if path:
+        return path
+    gbin = gammu_bin()
+    if not gbin:
+        return None
+    path = os.path.join(os.path.dirname(gbin), name + (".exe" if IS_WINDOWS else ""))
+    return path if os.path.exists(path) else None
+
+
+def start_smsd(sections, devices, connection):
+    """Sobe um gammu-smsd por modem; send_sms passa a usar o spool dele."""
+    stop_smsd()
+    smsd = _gammu_tool("gammu-smsd")
+    inject = _gammu_tool("gammu-smsd-inject")
+    if not smsd or not inject:
+        log_event("SMSD indisponivel (gammu-smsd/gammu-smsd-inject nao encontrados)")
+        return
+    for section, dev in zip(sections, devices):
+        base = os.path.join(SMSD_DIR, section)
+        dirs = {}
+        for name in ("inbox", "outbox", "sent", "error"):
+            dirs[name] = os.path.join(base, name)
+            os.makedirs(dirs[name], exist_ok=True)
+        lines = [
+            "[gammu]",
+            f"port = {dev}",
+            f"connection = {connection}",
+            "",
+            "[smsd]",
+            "service = files",
+            f"logfile = {os.path.join(base, 'smsd.log')}",
+            f"inboxpath = {dirs['inbox']}{os.sep}",
+            f"outboxpath = {dirs['outbox']}{os.sep}",
+            f"sentsmspath = {dirs['sent']}{os.sep}",
+            f"errorsmspath = {dirs['error']}{os.sep}",
+            "",
+        ]
+        config = os.path.join(base, "smsdrc")
+        with open(config, "w", encoding="utf-8") as f:
+            f.write("\n".join(lines))
+        try:
+            proc = subprocess.Popen(
+                [smsd, "-c", config],
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+            )
+        except Exception as e:
+            log_event(f"SMSD FAIL {dev} | {e}")
+            continue
+        _SMSD[section] = {"proc": proc, "config": config, "inject": inject, "dirs": dirs}
+        log_event(f"SMSD START {dev} via {section}")
+
+
+def stop_smsd():
+    for section, entry in list(_SMSD.items()):
+        proc = entry["proc"]
+        try:
+            proc.terminate()
+            proc.wait(timeout=5)
+        except Exception:
+            try:
+                proc.kill()
+            except Exception:
+                pass
+        _SMSD.pop(section, None)
+
+
+atexit.register(stop_smsd)
+
+
+def _smsd_send(entry, number, message, flash):
+    cmd = [entry["inject"], "-c", entry["config"], "TEXT", number, "-textutf8", message]
+    if flash:
+        cmd.append("-flash")
+    proc = subprocess.run(cmd, capture_output=True, text=True)
+    out = (proc.stdout or "").strip()
+    err = (proc.stderr or "").strip()
+    m = _RE_SMSD_WRITTEN.search(out)
+    if proc.returncode != 0 or not m:
+        return False, out, err
+    # O daemon move o arquivo do outbox para sent/ ou error/ mantendo o nome.
+    name = os.path.basename(m.group(1).strip())
+    sent = os.path.join(entry["dirs"]["sent"], name)
+    error = os.path.join(entry["dirs"]["error"], name)
+    deadline = time.monotonic() + SMSD_SEND_TIMEOUT_SEC
+    while time.monotonic() < deadline:
+        if os.path.exists(sent):
+            return True, out, err
+        if os.path.exists(error):
+            return False, out, "gammu-smsd: envio falhou (ver smsd.log)"
+        if entry["proc"].poll() is not None:
+            return False, out, "gammu-smsd encerrou"
+        time.sleep(0.5)
+    return False, out, "gammu-smsd: tempo esgotado aguardando envio"
+
+
 def send_sms(section, number, message, flash):
+    entry = _SMSD.get(section)
+    if entry is not None:
+        if entry["proc"].poll() is None:
+            return _smsd_send(entry, number, message, flash)
+        # Daemon caiu: a porta ficou livre, volta para o gammu direto.
+        _SMSD.pop(section, None)
     gbin = gammu_bin()
     if not gbin:
         return False, "", "Gammu nao encontrado. Instale e deixe 'gammu' no PATH (ex.: winget install Gammu.Gammu)."
@@ -585,7 +1315,12 @@ def send_sms(section, number, message, flash):
     ]
     if flash:
         cmd.append("-flash")
-    proc = subprocess.run(cmd, capture_output=True, text=True)
+    try:
+        proc = subprocess.run(cmd, capture_output=True, text=True)
+    except FileNotFoundError:
+        # Executavel salvo sumiu (desinstalado/movido): refaz a busca depois.
+        reset_gammu_bin()
+        return False, "", f"Gammu nao encontrado em {gbin}."
     ok = proc.returncode == 0
     out = (proc.stdout or "").strip()
     err = (proc.stderr or "").strip()
@@ -612,139 +1347,219 @@ def send_numbers(
     FAIL_LIMIT = 10
     ok_count = 0
     failed = []
+    total = len(recipients)
     total_modems = len(sections)
-    stop_index = len(recipients)
+    done = 0
+    started = set()
+    # Ultimo envio iniciado/concluido, mostrado pelo progress_cb: (num, idx, modem).
+    current = ["", 0, None]
+    lock = threading.Lock()
+    history_lock = threading.Lock()
+    changed = threading.Event()
+    stop = threading.Event()
+    # Um worker por modem; o lock do modem garante um envio por porta, mesmo
+    # quando outro worker usa o modem como alternativa apos uma falha.
+    modem_locks = [threading.Lock() for _ in sections]
+    pending = queue.Queue()
     for i, rec in enumerate(recipients):
-        num = rec.get("number", "")
-        name = _normalize_text(rec.get("name", ""))
-        if status_list is not None:
-            status_list[i] = "ENVIANDO"
-        ok = False
-        start_idx = i % total_modems if total_modems else 0
-        current_modem_label = None
-        for attempt in range(max(total_modems, 1)):
-            idx = (start_idx + attempt) % total_modems if total_modems else 0
-            section = sections[idx]
-            device = devices[idx]
-            current_modem_label = modem_labels.get(device, device) if modem_labels else device
-            if recipient_modems is not None:
-                recipient_modems[i] = current_modem_label
-            if modem_status is not None:
-                modem_status[device] = "ENVIANDO"
-            if progress_cb:
-                progress_cb(
-                    i,
-                    len(recipients),
-                    ok_count,
-                    len(failed),
-                    num,
-                    status_list,
-                    i,
-                    current_modem_label,
-                )
-            msg = message
-            if "<" in msg and ">" in msg:
-                msg = re.sub(r"<\s*name\s*>", name or "", msg, flags=re.IGNORECASE)
-            ok_try, out, err = send_sms(section, num, msg, flash)
-            if ok_try:
-                ok_count += 1
-                log_event(f"OK {num} via {section}")
-            else:
-                log_event(f"FAIL {num} via {section} | {err or out}")
-            if modem_status is not None:
-                modem_status[device] = "OK" if ok_try else "FAIL"
-            record = {
-                "ts": datetime.now().isoformat(timespec="seconds"),
-                "name": name,
-                "number": num,
-                "message": msg,
-                "flash": bool(flash),
-                "status": "OK" if ok_try else "FAIL",
-                "device": device,
-                "section": section,
-                "response": out or err,
-            }
+        pending.put((i, rec))
+
+    if random_delay_enabled:
+        try:
+            mn = float(random_delay_min_sec)
+            mx = float(random_delay_max_sec)
+        except Exception:
+            mn, mx = 0.0, 0.0
+        if mn < 0:
+            mn = 0.0
+        if mx < mn:
+            mx = mn
+
+    # Delay por modem: proximo envio permitido em cada porta (monotonic). Vale
+    # para qualquer envio no modem, inclusive o de outro worker em failover.
+    next_send = [0.0] * len(sections)
+
+    def send_delay():
+        if random_delay_enabled:
+            return random.uniform(mn, mx) if mx > 0 else 0.0
+        return delay_sec if delay_sec > 0 else 0.0
+
+    def add_history(record):
+        # ts gerado sob o mesmo lock da escrita: o arquivo segue cronologico.
+        with history_lock:
+            record["ts"] = _now_iso()
             append_history(record)
             if report_records is not None:
                 report_records.append(record)
-            if ok_try:
-                ok = True
-                break
-        if not ok:
-            failed.append(num)
-        if status_list is not None:
-            status_list[i] = "OK" if ok else "FAIL"
-        if progress_cb:
-            progress_cb(
-                i + 1,
-                len(recipients),
-                ok_count,
-                len(failed),
-                num,
-                status_list,
-                i,
-                current_modem_label,
-            )
-        if i < len(recipients) - 1:
-            if random_delay_enabled:
-                try:
-                    mn = float(random_delay_min_sec)
-                    mx = float(random_delay_max_sec)
-                except Exception:
-                    mn, mx = 0.0, 0.0
-                if mn < 0:
-                    mn = 0.0
-                if mx < mn:
-                    mx = mn
-                if mx > 0:
-                    time.sleep(random.uniform(mn, mx))
-            elif delay_sec > 0:
-                time.sleep(delay_sec)
-        if len(failed) >= FAIL_LIMIT:
-            stop_index = i + 1
-            break
 
-    # Se parou por limite de falhas, registra o restante como FAIL (skipped)
-    if stop_index < len(recipients):
-        for j in range(stop_index, len(recipients)):
-            rec = recipients[j]
+    has_name_tag = "<" in message and ">" in message
+
+    def render(name):
+        return _RE_NAME_TAG.sub(name or "", message) if has_name_tag else message
+
+    # Tudo que nao muda durante o envio sai do laco: rotulos, flags e, por
+    # worker, a ordem de tentativa dos modems ja resolvida.
+    flash_flag = bool(flash)
+    has_status = status_list is not None
+    has_modem_status = modem_status is not None
+    has_recipient_modems = recipient_modems is not None
+    targets = []
+    for idx, (section, device) in enumerate(zip(sections, devices)):
+        label = modem_labels.get(device, device) if modem_labels else device
+        targets.append((idx, section, device, label))
+
+    def worker(start_idx):
+        nonlocal ok_count, done
+        order = targets[start_idx:] + targets[:start_idx]
+        while not stop.is_set():
+            try:
+                i, rec = pending.get_nowait()
+            except queue.Empty:
+                return
             num = rec.get("number", "")
             name = _normalize_text(rec.get("name", ""))
-            if status_list is not None:
-                status_list[j] = "FAIL"
-            if recipient_modems is not None:
-                recipient_modems[j] = "SKIPPED"
-            record = {
-                "ts": datetime.now().isoformat(timespec="seconds"),
+            with lock:
+                started.add(i)
+                if has_status:
+                    status_list[i] = "ENVIANDO"
+            msg = render(name)
+            ok = False
+            attempted = False
+            current_modem_label = None
+            for idx, section, device, current_modem_label in order:
+                with modem_locks[idx]:
+                    wait = next_send[idx] - time.monotonic()
+                    if wait > 0 and stop.wait(wait):
+                        break
+                    with lock:
+                        if has_recipient_modems:
+                            recipient_modems[i] = current_modem_label
+                        if has_modem_status:
+                            modem_status[device] = "ENVIANDO"
+                        current[:] = [num, i, current_modem_label]
+                    changed.set()
+                    try:
+                        ok_try, out, err = send_sms(section, num, msg, flash)
+                    except Exception as exc:
+                        # Ex.: gammu-smsd-inject ausente. Conta como tentativa
+                        # com falha em vez de derrubar o worker com o numero
+                        # preso em ENVIANDO e sem registro no historico.
+                        ok_try, out, err = False, "", f"{type(exc).__name__}: {exc}"
+                    next_send[idx] = time.monotonic() + send_delay()
+                attempted = True
+                with lock:
+                    if ok_try:
+                        ok_count += 1
+                    if has_modem_status:
+                        modem_status[device] = "OK" if ok_try else "FAIL"
+                if ok_try:
+                    log_event(f"OK {num} via {section}")
+                else:
+                    log_event(f"FAIL {num} via {section} | {err or out}")
+                add_history(
+                    {
+                        "ts": "",
+                        "name": name,
+                        "number": num,
+                        "message": msg,
+                        "flash": flash_flag,
+                        "status": "OK" if ok_try else "FAIL",
+                        "device": device,
+                        "section": section,
+                        "response": out or err,
+                    }
+                )
+                if ok_try:
+                    ok = True
+                    break
+            with lock:
+                if not attempted:
+                    # Parou (limite de falhas) antes de qualquer tentativa:
+                    # entra no fim como skipped, com o registro no historico.
+                    started.discard(i)
+                    continue
+                if not ok:
+                    failed.append(num)
+                if has_status:
+                    status_list[i] = "OK" if ok else "FAIL"
+                done += 1
+                current[:] = [num, i, current_modem_label]
+                if len(failed) >= FAIL_LIMIT:
+                    stop.set()
+            changed.set()
+
+    def report_progress():
+        with lock:
+            args = (done, total, ok_count, len(failed), current[0], status_list, current[1], current[2])
+        progress_cb(*args)
+
+    workers = [
+        threading.Thread(target=worker, args=(idx,), daemon=True)
+        for idx in range(total_modems)
+    ]
+    for t in workers:
+        t.start()
+    # A tela (curses) so e desenhada daqui, na thread de quem chamou.
+    while any(t.is_alive() for t in workers):
+        if changed.wait(0.2):
+            changed.clear()
+            if progress_cb:
+                report_progress()
+    for t in workers:
+        t.join()
+    if progress_cb:
+        report_progress()
+
+    # Se parou por limite de falhas, registra o restante como FAIL (skipped)
+    skipped = [j for j in range(total) if j not in started]
+    for j in skipped:
+        rec = recipients[j]
+        num = rec.get("number", "")
+        name = _normalize_text(rec.get("name", ""))
+        if status_list is not None:
+            status_list[j] = "FAIL"
+        if recipient_modems is not None:
+            recipient_modems[j] = "SKIPPED"
+        add_history(
+            {
+                "ts": "",
                 "name": name,
                 "number": num,
-                "message": message,
+                "message": render(name),
                 "flash": bool(flash),
                 "status": "FAIL",
                 "device": "SKIPPED_FAIL_LIMIT",
                 "section": "-",
                 "response": "Skipped: fail limit reached",
             }
-            append_history(record)
-            if report_records is not None:
-                report_records.append(record)
-            if progress_cb:
-                progress_cb(
-                    j + 1,
-                    len(recipients),
-                    ok_count,
-                    len(failed),
-                    num,
-                    status_list,
-                    j,
-                    "SKIPPED",
-                )
+        )
+        done += 1
+        if progress_cb:
+            progress_cb(
+                done,
+                total,
+                ok_count,
+                len(failed),
+                num,
+                status_list,
+                j,
+                "SKIPPED",
+            )
+    flush_history()
+    flush_log()
     prune_history()
     return ok_count, failed
 
 
+# Ultimo quadro do draw_progress; qualquer outra tela que desenhe o invalida.
+_PROGRESS_FRAME = [None]
+
+
 def draw_header(stdscr, title):
-    stdscr.clear()
+    # erase (e nao clear): o refresh envia so as celulas que mudaram, em vez
+    # de repintar a tela inteira a cada quadro.
+    stdscr.erase()
+    _PROGRESS_FRAME[0] = None
     h, w = stdscr.getmaxyx()
     stdscr.addstr(0, 2, title, curses.A_BOLD)
     stdscr.hline(1, 0, "-", w)
@@ -777,20 +1592,19 @@ def draw_progress(
     modem_labels=None,
     delay_info=None,
 ):
-    draw_header(stdscr, title)
     h, w = stdscr.getmaxyx()
     if total <= 0:
         total = 1
-    stdscr.addstr(3, 2, f"Progresso: {sent}/{total}")
+    lines = [(3, f"Progresso: {sent}/{total}")]
     bar_width = max(10, w - 10)
     filled = int(bar_width * sent / total)
     if filled > bar_width:
         filled = bar_width
     bar = "[" + ("#" * filled) + ("-" * (bar_width - filled)) + "]"
-    stdscr.addstr(4, 2, bar[: max(w - 4, 0)])
-    stdscr.addstr(6, 2, f"OK: {ok_count}  FAIL: {fail_count}")
+    lines.append((4, bar[: max(w - 4, 0)]))
+    lines.append((6, f"OK: {ok_count}  FAIL: {fail_count}"))
     if delay_info:
-        stdscr.addstr(7, 2, f"Delay: {delay_info}"[: max(w - 4, 0)])
+        lines.append((7, f"Delay: {delay_info}"[: max(w - 4, 0)]))
     if modem_order and modem_status and modem_labels:
         parts = []
         for dev in modem_order:
@@ -798,15 +1612,15 @@ def draw_progress(
             status = modem_status.get(dev, "?")
             parts.append(f"{label}:{status}")
         line = "Modems: " + "  ".join(parts)
-        stdscr.addstr(8, 2, line[: max(w - 4, 0)])
+        lines.append((8, line[: max(w - 4, 0)]))
     if current_num:
         if current_modem:
-            stdscr.addstr(9, 2, f"Atual: {current_num} via {current_modem}")
+            lines.append((9, f"Atual: {current_num} via {current_modem}"))
         else:
-            stdscr.addstr(9, 2, f"Atual: {current_num}")
+            lines.append((9, f"Atual: {current_num}"))
     list_start = 12
     if recipients and status_list:
-        stdscr.addstr(list_start - 1, 2, "Fila:")
+        lines.append((list_start - 1, "Fila:"))
         available = max(0, h - (list_start + 1))
         if available > 0:
             total_items = len(recipients)
@@ -822,52 +1636,138 @@ def draw_progress(
                 if recipient_modems:
                     modem_label = f" {recipient_modems[idx]}"
                 line = f"{marker} {rec_label} [{status}]{modem_label}"
-                stdscr.addstr(y, 2, line[: max(w - 4, 0)])
+                lines.append((y, line[: max(w - 4, 0)]))
                 y += 1
-    stdscr.refresh()
+    # Quadro igual ao ultimo desenhado (mesmo tamanho de tela): nada a fazer.
+    frame = (id(stdscr), h, w, title, lines)
+    if frame == _PROGRESS_FRAME[0]:
+        return
+    draw_header(stdscr, title)
+    _PROGRESS_FRAME[0] = frame
+    for y, text in lines:
+        stdscr.addstr(y, 2, text)
+    stdscr.noutrefresh()
+    curses.doupdate()
 
 
-def menu(stdscr, title, options, index=0, tick_fn=None, tick_interval_sec=0):
+UI_MAX_FPS_DEFAULT = 30
+_UI_FRAME_SEC = [1.0 / UI_MAX_FPS_DEFAULT]
+
+
+def set_ui_max_fps(fps):
+    try:
+        fps = int(fps)
+    except (TypeError, ValueError):
+        fps = UI_MAX_FPS_DEFAULT
+    if fps <= 0:
+        fps = UI_MAX_FPS_DEFAULT
+    _UI_FRAME_SEC[0] = 1.0 / fps
+    return fps
+
+
+def menu(stdscr, title, options, index=0, tick_fn=None, tick_delay_sec=None):
+    # tick_fn devolve em quantos segundos quer rodar de novo (None: nada
+    # agendado). O getch espera ate esse prazo em vez de acordar a cada 500ms.
     curses.curs_set(0)
-    last_tick = time.time()
-    if tick_fn and tick_interval_sec > 0:
-        stdscr.timeout(500)
-    while True:
-        draw_header(stdscr, title)
-        h, w = stdscr.getmaxyx()
-        for i, opt in enumerate(options):
-            y = 3 + i
-            if y >= h - 2:
-                break
-            if i == index:
-                stdscr.addstr(y, 4, opt, curses.A_REVERSE)
-            else:
-                stdscr.addstr(y, 4, opt)
-        stdscr.addstr(h - 2, 2, "Setas: navegar  Enter: selecionar  Q: voltar")
-        stdscr.refresh()
-        key = stdscr.getch()
-        if key == -1:
-            if tick_fn and tick_interval_sec > 0:
-                now = time.time()
-                if now - last_tick >= tick_interval_sec:
+    next_tick = None
+    if tick_fn and tick_delay_sec is not None:
+        next_tick = time.monotonic() + tick_delay_sec
+    def draw_option(i):
+        y = 3 + i
+        if y >= h - 2:
+            return
+        if i == index:
+            stdscr.addstr(y, 4, options[i], curses.A_REVERSE)
+        else:
+            stdscr.addstr(y, 4, options[i])
+
+    # Tela inteira so na entrada e no KEY_RESIZE; setas redesenham as duas
+    # linhas afetadas e o tick (sem tecla) nao redesenha nada. Com tecla
+    # repetida mais rapido que o limite de quadros, as linhas sujas acumulam
+    # e saem num quadro so.
+    full = True
+    dirty = set()
+    last_paint = 0.0
+    try:
+        while True:
+            now = time.monotonic()
+            pending = full or bool(dirty)
+            if pending and now - last_paint >= _UI_FRAME_SEC[0]:
+                if full:
+                    draw_header(stdscr, title)
+                    h, w = stdscr.getmaxyx()
+                    for i in range(len(options)):
+                        draw_option(i)
+                    stdscr.addstr(h - 2, 2, "Setas: navegar  Enter: selecionar  Q: voltar")
+                    full = False
+                else:
+                    for i in dirty:
+                        draw_option(i)
+                dirty.clear()
+                stdscr.noutrefresh()
+                curses.doupdate()
+                last_paint = now
+                pending = False
+            wait = None if next_tick is None else next_tick - now
+            if pending:
+                left = last_paint + _UI_FRAME_SEC[0] - now
+                wait = left if wait is None else min(wait, left)
+            stdscr.timeout(-1 if wait is None else max(int(wait * 1000) + 1, 0))
+            key = stdscr.getch()
+            if key == -1:
+                if next_tick is not None and time.monotonic() >= next_tick:
                     try:
-                        tick_fn()
+                        delay = tick_fn()
                     except Exception:
-                        pass
-                    last_tick = now
+                        delay = 1.0
+                    next_tick = None if delay is None else time.monotonic() + delay
+                continue
+            if key == curses.KEY_RESIZE:
+                full = True
+                continue
+            if key in (ord("q"), ord("Q")):
+                return None
+            if key in (curses.KEY_UP, ord("k")):
+                dirty.add(index)
+                index = (index - 1) % len(options)
+                dirty.add(index)
+            elif key in (curses.KEY_DOWN, ord("j")):
+                dirty.add(index)
+                index = (index + 1) % len(options)
+                dirty.add(index)
+            elif key in (10, 13, curses.KEY_ENTER):
+                return index
+    finally:
+        stdscr.timeout(-1)
+
+def _unpack_rescan(result):
+    if isinstance(result, tuple) and len(result) == 4:
+        return result
+    items, status, numbers = result
+    return items, status, numbers, None
+
+
+def _rescan_worker(rescan_fn, result_q, stop_evt, interval_sec, scan_lock, sched):
+    # Roda fora da thread da UI: o scan (subprocessos do gammu) nao congela a tela.
+    # scan_lock e o mesmo do rescan manual (R), entao nunca ha duas sondagens
+    # nas mesmas portas; sched["next"] e reagendado pelo R, e sched["gen"]
+    # marca o resultado para a UI descartar o que ficou velho.
+    while not stop_evt.is_set():
+        wait = sched["next"] - time.monotonic()
+        if wait > 0:
+            stop_evt.wait(wait)
             continue
-        if key in (ord("q"), ord("Q")):
-            if tick_fn and tick_interval_sec > 0:
-                stdscr.timeout(-1)
-            return None
-        if key in (curses.KEY_UP, ord("k")):
-            index = (index - 1) % len(options)
-        elif key in (curses.KEY_DOWN, ord("j")):
-            index = (index + 1) % len(options)
-        elif key in (10, 13, curses.KEY_ENTER):
-            if tick_fn and tick_interval_sec > 0:
-                stdscr.timeout(-1)
-            return index
+        with scan_lock:
+            if stop_evt.is_set() or time.monotonic() < sched["next"]:
+                continue
+            gen = sched["gen"]
+            try:
+                result = rescan_fn()
+            except Exception:
+                result = None
+            sched["next"] = time.monotonic() + interval_sec
+        if result is not None:
+            result_q.put((gen, result))
 
 
 def checkbox_list(
@@ -884,95 +1784,177 @@ def checkbox_list(
 ):
     curses.curs_set(0)
     index = 0
-    notice = ""
-    last_scan = time.time()
-    if rescan_fn and rescan_interval_sec > 0:
-        stdscr.timeout(500)
-    while True:
-        draw_header(stdscr, title)
-        h, w = stdscr.getmaxyx()
-        if not items:
-            stdscr.addstr(3, 4, "Nenhum modem detectado. Pressione R para rescan.")
-        for i, it in enumerate(items):
-            y = 3 + i
-            if y >= h - 3:
-                break
-            mark = "[x]" if it in checked else "[ ]"
-            label = labels.get(it, it) if labels else it
-            st = ""
-            if status is not None:
-                st = status.get(it, "?")
-                st = f" [{st}]"
-            num = ""
-            if numbers is not None:
-                num = numbers.get(it, "-")
-                num = f" {numbers_label}:{num}"
-            line = f"{mark} {label}{st}{num}"
-            if i == index:
-                stdscr.addstr(y, 4, line, curses.A_REVERSE)
-            else:
-                stdscr.addstr(y, 4, line)
-        if notice:
-            stdscr.addstr(h - 3, 2, notice[: w - 4])
-        if rescan_fn and rescan_interval_sec > 0:
-            now = time.time()
-            remaining = int(max(0, rescan_interval_sec - (now - last_scan)))
-            stdscr.addstr(
-                h - 2,
-                2,
-                f"Espaco: marcar  R: rescan  Auto: {rescan_interval_sec}s (em {remaining}s)  S: salvar  Q: voltar",
-            )
+    notice = ""
+    last_scan = time.time()
+    auto_rescan = bool(rescan_fn and rescan_interval_sec > 0)
+    result_q = queue.Queue()
+    stop_evt = threading.Event()
+    scan_lock = threading.Lock()
+    sched = {"gen": 0, "next": time.monotonic() + rescan_interval_sec}
+    worker = None
+    if auto_rescan:
+        worker = threading.Thread(
+            target=_rescan_worker,
+            args=(rescan_fn, result_q, stop_evt, rescan_interval_sec, scan_lock, sched),
+            daemon=True,
+        )
+        worker.start()
+    # So as linhas visiveis [top, top + rows) sao desenhadas; com muitos
+    # devices a lista rola para manter o cursor na tela.
+    top = 0
+    rows = 1
+
+    def draw_row(i, h):
+        y = 3 + i - top
+        if i < top or y >= h - 3:
+            return
+        it = items[i]
+        mark = "[x]" if it in checked else "[ ]"
+        label = labels.get(it, it) if labels else it
+        st = ""
+        if status is not None:
+            st = status.get(it, "?")
+            st = f" [{st}]"
+        num = ""
+        if numbers is not None:
+            num = numbers.get(it, "-")
+            num = f" {numbers_label}:{num}"
+        line = f"{mark} {label}{st}{num}"
+        stdscr.move(y, 0)
+        stdscr.clrtoeol()
+        if i == index:
+            stdscr.addstr(y, 4, line, curses.A_REVERSE)
         else:
-            stdscr.addstr(h - 2, 2, "Espaco: marcar  R: rescan  S: salvar  Q: voltar")
-        stdscr.refresh()
-        key = stdscr.getch()
-        if key == -1:
-            if rescan_fn and rescan_interval_sec > 0:
-                now = time.time()
-                if now - last_scan >= rescan_interval_sec:
-                    result = rescan_fn()
-                    if isinstance(result, tuple) and len(result) == 4:
-                        items, status, numbers, labels = result
-                    else:
-                        items, status, numbers = result
-                        labels = None
-                    checked.intersection_update(set(items))
-                    last_scan = now
-            continue
-        if key in (ord("q"), ord("Q")):
-            if rescan_fn and rescan_interval_sec > 0:
-                stdscr.timeout(-1)
-            return checked
-        if key in (ord("s"), ord("S")):
-            if rescan_fn and rescan_interval_sec > 0:
-                stdscr.timeout(-1)
-            return checked
-        if key in (ord("r"), ord("R")):
-            if rescan_fn:
-                result = rescan_fn()
-                if isinstance(result, tuple) and len(result) == 4:
-                    items, status, numbers, labels = result
-                else:
-                    items, status, numbers = result
-                    labels = None
+            stdscr.addstr(y, 4, line)
+
+    # Tela inteira so quando a lista/aviso/tamanho muda; mover o cursor ou
+    # marcar redesenha apenas as linhas afetadas, e o tick so o rodape.
+    full = True
+    dirty = set()
+    last_footer = None
+    try:
+        while True:
+            try:
+                gen, result = result_q.get_nowait()
+            except queue.Empty:
+                pass
+            else:
+                if gen != sched["gen"]:
+                    # Scan de fundo anterior a um R: o resultado do R e mais novo.
+                    continue
+                items, status, numbers, labels = _unpack_rescan(result)
                 checked.intersection_update(set(items))
+                index = min(index, max(len(items) - 1, 0))
                 last_scan = time.time()
+                full = True
+            if full:
+                # Geometria so muda com KEY_RESIZE, que sempre pede tela inteira.
+                h, w = stdscr.getmaxyx()
+                rows = max(h - 6, 1)
+                top = min(max(top, index - rows + 1), index)
+                top = max(min(top, len(items) - rows), 0)
+                draw_header(stdscr, title)
+                if not items:
+                    stdscr.addstr(3, 4, "Nenhum modem detectado. Pressione R para rescan.")
+                for i in range(top, min(len(items), top + rows)):
+                    draw_row(i, h)
+                if notice:
+                    stdscr.addstr(h - 3, 2, notice[: w - 4])
+                last_footer = None
+                full = False
+            else:
+                for i in dirty:
+                    if 0 <= i < len(items):
+                        draw_row(i, h)
+            dirty.clear()
+            if auto_rescan:
+                now = time.time()
+                remaining = int(max(0, rescan_interval_sec - (now - last_scan)))
+                footer = f"Espaco: marcar  R: rescan  Auto: {rescan_interval_sec}s (em {remaining}s)  S: salvar  Q: voltar"
+            else:
+                footer = "Espaco: marcar  R: rescan  S: salvar  Q: voltar"
+            if footer != last_footer:
+                stdscr.move(h - 2, 0)
+                stdscr.clrtoeol()
+                stdscr.addstr(h - 2, 2, footer)
+                last_footer = footer
+            stdscr.noutrefresh()
+            curses.doupdate()
+            if auto_rescan:
+                # Acorda so quando o contador (em segundos) do rodape muda, em
+                # vez de um tick fixo; com o scan vencido, espera o resultado
+                # do worker em passos curtos.
+                left = rescan_interval_sec - (time.time() - last_scan)
+                if left > 0:
+                    stdscr.timeout(int((left - int(left)) * 1000) + 1)
+                else:
+                    stdscr.timeout(200)
+            key = stdscr.getch()
+            if key == -1:
                 continue
-            return "__RESCAN__"
-        if key in (curses.KEY_UP, ord("k")):
-            index = (index - 1) % max(len(items), 1)
-        elif key in (curses.KEY_DOWN, ord("j")):
-            index = (index + 1) % max(len(items), 1)
-        elif key == ord(" ") and items:
-            dev = items[index]
-            if status is not None and status.get(dev) == "FAIL":
-                notice = "Modem com FAIL bloqueado para selecao."
+            if key == curses.KEY_RESIZE:
+                full = True
                 continue
-            notice = ""
-            if dev in checked:
-                checked.remove(dev)
-            else:
-                checked.add(dev)
+            if key in (ord("q"), ord("Q")):
+                return checked
+            if key in (ord("s"), ord("S")):
+                return checked
+            if key in (ord("r"), ord("R")):
+                if rescan_fn:
+                    # Espera um scan de fundo em andamento em vez de sondar as
+                    # mesmas portas em paralelo, e reinicia o agendamento.
+                    with scan_lock:
+                        result = rescan_fn()
+                        sched["gen"] += 1
+                        sched["next"] = time.monotonic() + rescan_interval_sec
+                    items, status, numbers, labels = _unpack_rescan(result)
+                    checked.intersection_update(set(items))
+                    index = min(index, max(len(items) - 1, 0))
+                    last_scan = time.time()
+                    full = True
+                    continue
+                return "__RESCAN__"
+            if key in (curses.KEY_UP, ord("k")):
+                dirty.add(index)
+                index = (index - 1) % max(len(items), 1)
+                dirty.add(index)
+                if not top <= index < top + rows:
+                    full = True
+            elif key in (curses.KEY_DOWN, ord("j")):
+                dirty.add(index)
+                index = (index + 1) % max(len(items), 1)
+                dirty.add(index)
+                if not top <= index < top + rows:
+                    full = True
+            elif key == ord(" ") and items:
+                dev = items[index]
+                if status is not None and status.get(dev) == "FAIL":
+                    notice = "Modem com FAIL bloqueado para selecao."
+                    full = True
+                    continue
+                if notice:
+                    notice = ""
+                    full = True
+                if dev in checked:
+                    checked.remove(dev)
+                else:
+                    checked.add(dev)
+                dirty.add(index)
+    finally:
+        stop_evt.set()
+        if auto_rescan:
+            stdscr.timeout(-1)
+        if worker is not None:
+            if scan_lock.locked():
+                h, w = stdscr.getmaxyx()
+                stdscr.move(h - 2, 0)
+                stdscr.clrtoeol()
+                stdscr.addstr(h - 2, 2, "Aguardando scan em andamento..."[: w - 4])
+                stdscr.noutrefresh()
+                curses.doupdate()
+            # Quem chamou vai usar as portas (envio/ativacao): nenhuma sondagem
+            # pode continuar depois do retorno.
+            worker.join()
 
 
 def prompt_input(stdscr, title, prompt, initial="", replace_on_type=False):
@@ -988,7 +1970,8 @@ def prompt_input(stdscr, title, prompt, initial="", replace_on_type=False):
         stdscr.addstr(5, 6, display)
         stdscr.clrtoeol()
         stdscr.addstr(h - 2, 2, "Enter: ok  ESC: cancelar  Ctrl+U: limpar")
-        stdscr.refresh()
+        stdscr.noutrefresh()
+        curses.doupdate()
         try:
             key = stdscr.get_wch()
         except Exception:
@@ -1091,61 +2074,91 @@ def choose_file_dialog():
     return None
 
 
+def _clipboard_worker(result_q):
+    result_q.put(read_clipboard())
+
+
 def multiline_input(stdscr, title, hint):
     curses.curs_set(1)
     lines = []
     current = ""
-    while True:
-        draw_header(stdscr, title)
-        h, w = stdscr.getmaxyx()
-        stdscr.addstr(3, 2, hint)
-        y = 5
-        for line in lines[-(h - 8):]:
-            stdscr.addstr(y, 4, line[: w - 8])
-            y += 1
-        stdscr.addstr(y, 4, (current + "|")[: w - 8])
-        stdscr.addstr(h - 2, 2, "F2: ok  ESC: cancelar  Enter: nova linha  Ctrl+V: colar")
-        stdscr.refresh()
-        key = stdscr.get_wch()
-        if key in (27, "\x1b", curses.KEY_EXIT):
-            return None
-        if key == curses.KEY_F2:
-            if current:
+    # Ctrl+V le o clipboard numa thread (powershell/xclip podem demorar);
+    # enquanto isso a tela segue respondendo e o getch vira polling curto.
+    paste_q = None
+    try:
+        while True:
+            if paste_q is not None:
+                try:
+                    paste = paste_q.get_nowait()
+                except queue.Empty:
+                    pass
+                else:
+                    paste_q = None
+                    stdscr.timeout(-1)
+                    if paste:
+                        parts = paste.splitlines()
+                        if parts:
+                            current += parts[0]
+                            for mid in parts[1:-1]:
+                                lines.append(current)
+                                current = mid
+                            if len(parts) > 1:
+                                lines.append(current)
+                                current = parts[-1]
+            draw_header(stdscr, title)
+            h, w = stdscr.getmaxyx()
+            stdscr.addstr(3, 2, hint)
+            y = 5
+            addstr = stdscr.addstr
+            for line in lines[-(h - 8):]:
+                addstr(y, 4, line[: w - 8])
+                y += 1
+            addstr(y, 4, (current + "|")[: w - 8])
+            if paste_q is not None:
+                stdscr.addstr(h - 2, 2, "Colando do clipboard...")
+            else:
+                stdscr.addstr(h - 2, 2, "F2: ok  ESC: cancelar  Enter: nova linha  Ctrl+V: colar")
+            stdscr.noutrefresh()
+            curses.doupdate()
+            try:
+                key = stdscr.get_wch()
+            except curses.error:
+                continue
+            if key in (27, "\x1b", curses.KEY_EXIT):
+                return None
+            if key == curses.KEY_F2:
+                if current:
+                    lines.append(current)
+                return "\n".join(lines).strip()
+            if key in (10, 13, curses.KEY_ENTER, "\n", "\r"):
                 lines.append(current)
-            return "\n".join(lines).strip()
-        if key in (10, 13, curses.KEY_ENTER, "\n", "\r"):
-            lines.append(current)
-            current = ""
-            continue
-        if key in (
-            curses.KEY_BACKSPACE,
-            curses.KEY_DC,
-            127,
-            8,
-            "\x7f",
-            "\b",
-        ):
-            current = current[:-1]
-            continue
-        if key in (21, "\x15"):
-            current = ""
-            continue
-        if key in (22, "\x16"):
-            paste = read_clipboard()
-            if paste:
-                parts = paste.splitlines()
-                if parts:
-                    current += parts[0]
-                    for mid in parts[1:-1]:
-                        lines.append(current)
-                        current = mid
-                    if len(parts) > 1:
-                        lines.append(current)
-                        current = parts[-1]
-            continue
-        if isinstance(key, str) and key:
-            if ord(key) >= 32 and key != "\x7f":
-                current += key
+                current = ""
+                continue
+            if key in (
+                curses.KEY_BACKSPACE,
+                curses.KEY_DC,
+                127,
+                8,
+                "\x7f",
+                "\b",
+            ):
+                current = current[:-1]
+                continue
+            if key in (21, "\x15"):
+                current = ""
+                continue
+            if key in (22, "\x16"):
+                if paste_q is None:
+                    paste_q = queue.Queue()
+                    threading.Thread(target=_clipboard_worker, args=(paste_q,), daemon=True).start()
+                    stdscr.timeout(50)
+                continue
+            if isinstance(key, str) and key:
+                if ord(key) >= 32 and key != "\x7f":
+                    current += key
+    finally:
+        if paste_q is not None:
+            stdscr.timeout(-1)
 
 
 def message_screen(stdscr, title, lines, wait=True):
@@ -1160,24 +2173,33 @@ def message_screen(stdscr, title, lines, wait=True):
         y += 1
     if wait:
         stdscr.addstr(h - 2, 2, "Pressione qualquer tecla para voltar")
-        stdscr.refresh()
+        stdscr.noutrefresh()
+        curses.doupdate()
         stdscr.getch()
 
 
 def confirm_screen(stdscr, title, lines):
     curses.curs_set(0)
+    # Conteudo fixo: desenha uma vez e de novo so se o terminal mudar de tamanho.
+    redraw = True
     while True:
-        draw_header(stdscr, title)
-        h, w = stdscr.getmaxyx()
-        y = 3
-        for line in lines:
-            if y >= h - 3:
-                break
-            stdscr.addstr(y, 2, line[: w - 4])
-            y += 1
-        stdscr.addstr(h - 2, 2, "Enter: enviar  Q: cancelar")
-        stdscr.refresh()
+        if redraw:
+            draw_header(stdscr, title)
+            h, w = stdscr.getmaxyx()
+            y = 3
+            for line in lines:
+                if y >= h - 3:
+                    break
+                stdscr.addstr(y, 2, line[: w - 4])
+                y += 1
+            stdscr.addstr(h - 2, 2, "Enter: enviar  Q: cancelar")
+            stdscr.noutrefresh()
+            curses.doupdate()
+            redraw = False
         key = stdscr.getch()
+        if key == curses.KEY_RESIZE:
+            redraw = True
+            continue
         if key in (ord("q"), ord("Q")):
             return False
         if key in (10, 13, curses.KEY_ENTER):
@@ -1186,18 +2208,26 @@ def confirm_screen(stdscr, title, lines):
 
 def retry_screen(stdscr, title, lines):
     curses.curs_set(0)
+    # Conteudo fixo: desenha uma vez e de novo so se o terminal mudar de tamanho.
+    redraw = True
     while True:
-        draw_header(stdscr, title)
-        h, w = stdscr.getmaxyx()
-        y = 3
-        for line in lines:
-            if y >= h - 3:
-                break
-            stdscr.addstr(y, 2, line[: w - 4])
-            y += 1
-        stdscr.addstr(h - 2, 2, "R: reenviar falhas  Q: sair")
-        stdscr.refresh()
+        if redraw:
+            draw_header(stdscr, title)
+            h, w = stdscr.getmaxyx()
+            y = 3
+            for line in lines:
+                if y >= h - 3:
+                    break
+                stdscr.addstr(y, 2, line[: w - 4])
+                y += 1
+            stdscr.addstr(h - 2, 2, "R: reenviar falhas  Q: sair")
+            stdscr.noutrefresh()
+            curses.doupdate()
+            redraw = False
         key = stdscr.getch()
+        if key == curses.KEY_RESIZE:
+            redraw = True
+            continue
         if key in (ord("q"), ord("Q")):
             return False
         if key in (ord("r"), ord("R")):
@@ -1211,11 +2241,12 @@ def default_export_path(prefix):
 
 def export_csv(path, headers, rows):
     try:
-        with open(path, "w", encoding="utf-8", newline="") as f:
+        # Buffer de 1 MiB + writerows (laco em C): poucas escritas mesmo com
+        # o historico inteiro.
+        with open(path, "w", encoding="utf-8", newline="", buffering=1 << 20) as f:
             writer = csv.writer(f, delimiter=";")
             writer.writerow(headers)
-            for row in rows:
-                writer.writerow(row)
+            writer.writerows(rows)
         return True, ""
     except Exception as e:
         return False, str(e)
@@ -1251,24 +2282,50 @@ def read_clipboard():
     return ""
 
 
+def tail_lines(path, n=500, block=65536):
+    """Ultimas `n` linhas do arquivo, lendo blocos a partir do fim."""
+    chunks = []
+    newlines = 0
+    with open(path, "rb") as f:
+        pos = f.seek(0, os.SEEK_END)
+        while pos > 0 and newlines <= n:
+            step = min(block, pos)
+            pos -= step
+            f.seek(pos)
+            chunk = f.read(step)
+            chunks.append(chunk)
+            newlines += chunk.count(b"\n")
+    data = b"".join(reversed(chunks))
+    return data.decode("utf-8", "replace").splitlines()[-n:]
+
+
 def view_log(stdscr):
+    flush_log()
     if not os.path.exists(LOG_PATH):
         message_screen(stdscr, "Log", ["Log vazio."])
         return
-    with open(LOG_PATH, "r", encoding="utf-8") as f:
-        lines = f.read().splitlines()
+    lines = tail_lines(LOG_PATH)
     index = max(len(lines) - 200, 0)
+    # Geometria lida so no primeiro quadro e apos KEY_RESIZE/sub-tela.
+    drawn = None
     while True:
-        draw_header(stdscr, "Log (ultimas linhas)")
-        h, w = stdscr.getmaxyx()
-        visible = lines[index : index + (h - 5)]
-        y = 3
-        for line in visible:
-            stdscr.addstr(y, 2, line[: w - 4])
-            y += 1
-        stdscr.addstr(h - 2, 2, "Setas: rolar  Q: voltar")
-        stdscr.refresh()
+        if drawn is None:
+            h, w = stdscr.getmaxyx()
+        # Tecla que nao move a janela (ex.: seta no limite) nao redesenha nada.
+        if drawn != index:
+            draw_header(stdscr, "Log (ultimas linhas)")
+            visible = lines[index : index + (h - 5)]
+            addstr = stdscr.addstr
+            for y, line in enumerate(visible, start=3):
+                addstr(y, 2, line[: w - 4])
+            stdscr.addstr(h - 2, 2, "Setas: rolar  Q: voltar")
+            stdscr.noutrefresh()
+            curses.doupdate()
+            drawn = index
         key = stdscr.getch()
+        if key == curses.KEY_RESIZE:
+            drawn = None
+            continue
         if key in (ord("q"), ord("Q")):
             return
         if key in (curses.KEY_UP, ord("k")):
@@ -1296,6 +2353,7 @@ def help_screen(stdscr):
         "- Comandos AT: ex. AT+ZCDRUN=8 (seu modem pode exigir)",
         "- Auto ativar AT: envia os comandos ao iniciar o programa",
         "- Keepalive AT: envia AT periodicamente para evitar inatividade",
+        "- gammu-smsd: mantem um daemon por modem durante o envio",
         "",
         "Dicas:",
         "- Se travar, desative Validar modems e Mostrar numero do chip",
@@ -1320,15 +2378,60 @@ def release_ports(selected_devices):
         return []
     if not selected_devices:
         return []
+    # Um unico fuser para todas as portas; com stderr junto, cada porta em uso
+    # sai como "<dev>:  <pids>". Porta ausente da saida nao tinha processo.
+    try:
+        proc = subprocess.run(
+            ["fuser", "-k", *selected_devices],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            text=True,
+            timeout=5,
+            env=dict(os.environ, LC_ALL="C"),
+        )
+    except Exception:
+        with ThreadPoolExecutor(max_workers=min(8, len(selected_devices))) as ex:
+            return list(ex.map(_kill_port_users, selected_devices))
+    # Nomes do by-path tem ":" (ex.: usb-0:1.4:1.0-port0): casa o prefixo
+    # "<dev>:" inteiro, do nome mais longo para o mais curto.
+    by_len = sorted(set(selected_devices), key=len, reverse=True)
+    found = {}
+    for line in (proc.stdout or "").splitlines():
+        for dev in by_len:
+            if line.startswith(dev + ":"):
+                pids = line[len(dev) + 1:].strip()
+                if pids:
+                    found[dev] = pids
+                break
+    if not found and proc.returncode == 0:
+        # fuser matou algo mas sem "<dev>:" na saida (ex.: BusyBox imprime so
+        # os PIDs): refaz por device. O que ja morreu no fuser conjunto nao
+        # aparece de novo, entao esses PIDs vao junto no resultado, sem porta.
+        killed = (proc.stdout or "").strip()
+        with ThreadPoolExecutor(max_workers=min(8, len(selected_devices))) as ex:
+            per_dev = list(ex.map(_kill_port_users, selected_devices))
+        return [
+            (dev, 0, killed, "PIDs encerrados sem porta identificada pelo fuser")
+            if code != 0 and killed
+            else (dev, code, out, err)
+            for dev, code, out, err in per_dev
+        ]
     results = []
     for dev in selected_devices:
-        cmd = ["fuser", "-k", dev]
-        proc = subprocess.run(cmd, capture_output=True, text=True)
-        out = (proc.stdout or "").strip()
-        err = (proc.stderr or "").strip()
-        results.append((dev, proc.returncode, out, err))
+        if dev in found:
+            results.append((dev, 0, found[dev], ""))
+        else:
+            results.append((dev, 1, "", "nenhum processo usando a porta"))
     return results
 
+
+def _kill_port_users(dev):
+    cmd = ["fuser", "-k", dev]
+    proc = subprocess.run(cmd, capture_output=True, text=True)
+    out = (proc.stdout or "").strip()
+    err = (proc.stderr or "").strip()
+    return dev, proc.returncode, out, err
+
 def release_ports_screen(stdscr, cfg, devices):
     if IS_WINDOWS:
         message_screen(stdscr, "Liberar portas", ["Disponivel apenas no Linux."])
@@ -1358,18 +2461,17 @@ def release_ports_screen(stdscr, cfg, devices):
     message_screen(stdscr, "Liberar portas", msg)
 
 def history_candidates():
-    records = load_history()
+    records = load_history_cached()
     if not records:
         return [], {}
+    # Do mais recente para o mais antigo: a ordem de insercao do dict ja e a
+    # ordem da lista, sem uma lista paralela.
     latest = {}
-    order = []
     for rec in reversed(records):
-        num = rec.get("number") or ""
-        if not num or num in latest:
-            continue
-        latest[num] = rec
-        order.append(num)
-    return order, latest
+        num = rec.get("number")
+        if num and num not in latest:
+            latest[num] = rec
+    return list(latest), latest
 
 def resend_from_history(stdscr, cfg, devices):
     numbers, meta = history_candidates()
@@ -1396,7 +2498,8 @@ def resend_from_history(stdscr, cfg, devices):
     )
     if not result:
         return
-    selected = sorted(result, key=lambda n: numbers.index(n))
+    pos = {n: i for i, n in enumerate(numbers)}
+    selected = sorted(result, key=pos.__getitem__)
     recipients = [{"number": n, "name": meta.get(n, {}).get("name", "")} for n in selected]
     message = multiline_input(
         stdscr,
@@ -1414,33 +2517,59 @@ def resend_from_history(stdscr, cfg, devices):
     flash = flash_choice == 0
     send_flow(stdscr, cfg, devices, recipients, message, flash)
 
+_HISTORY_LINES = {"records": None, "lines": None}
+# A tela so rola pelos registros mais recentes; o F6 ainda exporta tudo.
+HISTORY_SCREEN_MAX = 2000
+
+
+def _history_lines(records):
+    # load_history_cached devolve a mesma lista enquanto o arquivo nao muda:
+    # reabrir a tela reaproveita as linhas ja formatadas.
+    if _HISTORY_LINES["records"] is records:
+        return _HISTORY_LINES["lines"]
+    lines = [
+        " ".join(
+            (
+                str(rec.get("ts") or ""),
+                str(rec.get("status") or ""),
+                str(rec.get("number") or ""),
+                str(rec.get("device") or ""),
+                str(rec.get("message") or "")[:30].replace("\n", " "),
+            )
+        )
+        for rec in records[-HISTORY_SCREEN_MAX:]
+    ]
+    _HISTORY_LINES.update(records=records, lines=lines)
+    return lines
+
+
 def history_screen(stdscr):
-    records = load_history()
+    records = load_history_cached()
     if not records:
         message_screen(stdscr, "Historico", ["Historico vazio."])
         return
-    lines = []
-    for rec in records:
-        ts = rec.get("ts", "")
-        status = rec.get("status", "")
-        num = rec.get("number", "")
-        dev = rec.get("device", "")
-        msg = rec.get("message", "")
-        msg = msg.replace("\n", " ")[:30]
-        line = f"{ts} {status} {num} {dev} {msg}"
-        lines.append(line)
+    lines = _history_lines(records)
     index = max(len(lines) - 200, 0)
+    rows = None
+    # Geometria lida so no primeiro quadro e apos KEY_RESIZE/sub-tela.
+    drawn = None
     while True:
-        draw_header(stdscr, "Historico (ultimos registros)")
-        h, w = stdscr.getmaxyx()
-        visible = lines[index : index + (h - 5)]
-        y = 3
-        for line in visible:
-            stdscr.addstr(y, 2, line[: w - 4])
-            y += 1
-        stdscr.addstr(h - 2, 2, "Setas: rolar  F6: exportar CSV  Q: voltar")
-        stdscr.refresh()
+        if drawn is None:
+            h, w = stdscr.getmaxyx()
+        if drawn != index:
+            draw_header(stdscr, "Historico (ultimos registros)")
+            visible = lines[index : index + (h - 5)]
+            addstr = stdscr.addstr
+            for y, line in enumerate(visible, start=3):
+                addstr(y, 2, line[: w - 4])
+            stdscr.addstr(h - 2, 2, "Setas: rolar  F6: exportar CSV  Q: voltar")
+            stdscr.noutrefresh()
+            curses.doupdate()
+            drawn = index
         key = stdscr.getch()
+        if key == curses.KEY_RESIZE:
+            drawn = None
+            continue
         if key in (ord("q"), ord("Q")):
             return
         if key == curses.KEY_F6:
@@ -1452,24 +2581,13 @@ def history_screen(stdscr):
                 default_path,
                 replace_on_type=True,
             )
+            drawn = None
             if not path:
                 continue
             headers = ["ts", "name", "number", "message", "flash", "status", "device", "section", "response"]
-            rows = []
-            for rec in records:
-                rows.append(
-                    [
-                        rec.get("ts", ""),
-                        rec.get("name", ""),
-                        rec.get("number", ""),
-                        rec.get("message", ""),
-                        rec.get("flash", ""),
-                        rec.get("status", ""),
-                        rec.get("device", ""),
-                        rec.get("section", ""),
-                        rec.get("response", ""),
-                    ]
-                )
+            if rows is None:
+                # Montadas no primeiro F6 e reaproveitadas nas exportacoes seguintes.
+                rows = [[rec.get(k, "") for k in headers] for rec in records]
             ok, err = export_csv(path, headers, rows)
             if ok:
                 message_screen(stdscr, "Exportar CSV", [f"Salvo em: {path}"])
@@ -1483,20 +2601,27 @@ def history_screen(stdscr):
 
 
 def build_report(records):
-    stats = {}
+    # Acumula em listas [total, ok, fail, last_ts] e so no fim monta os dicts.
+    acc = {}
+    acc_get = acc.get
     for rec in records:
         dev = rec.get("device", "") or "-"
-        status = (rec.get("status", "") or "").upper()
-        entry = stats.setdefault(dev, {"total": 0, "ok": 0, "fail": 0, "last_ts": ""})
-        entry["total"] += 1
-        if status == "OK":
-            entry["ok"] += 1
-        elif status == "FAIL":
-            entry["fail"] += 1
+        entry = acc_get(dev)
+        if entry is None:
+            entry = acc[dev] = [0, 0, 0, ""]
+        entry[0] += 1
+        status = rec.get("status", "") or ""
+        if status == "OK" or status.upper() == "OK":
+            entry[1] += 1
+        elif status == "FAIL" or status.upper() == "FAIL":
+            entry[2] += 1
         ts = rec.get("ts", "")
-        if ts and (not entry["last_ts"] or ts > entry["last_ts"]):
-            entry["last_ts"] = ts
-    return stats
+        if ts and ts > entry[3]:
+            entry[3] = ts
+    return {
+        dev: {"total": total, "ok": ok, "fail": fail, "last_ts": last_ts}
+        for dev, (total, ok, fail, last_ts) in acc.items()
+    }
 
 
 def build_report_from_records(records):
@@ -1509,7 +2634,7 @@ def build_report_from_records(records):
 
 
 def report_screen(stdscr):
-    records = load_history()
+    records = load_history_cached()
     now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     if not records:
         message_screen(stdscr, "Relatorio", ["Historico vazio."])
@@ -1524,17 +2649,25 @@ def report_screen(stdscr):
         line = f"{dev} | total:{entry['total']} ok:{entry['ok']} fail:{entry['fail']} | ultimo:{entry['last_ts']}"
         lines.append(line)
     index = 0
+    # Geometria lida so no primeiro quadro e apos KEY_RESIZE/sub-tela.
+    drawn = None
     while True:
-        draw_header(stdscr, "Relatorio")
-        h, w = stdscr.getmaxyx()
-        visible = lines[index : index + (h - 5)]
-        y = 3
-        for line in visible:
-            stdscr.addstr(y, 2, line[: w - 4])
-            y += 1
-        stdscr.addstr(h - 2, 2, "Setas: rolar  F6: exportar CSV  Q: voltar")
-        stdscr.refresh()
+        if drawn is None:
+            h, w = stdscr.getmaxyx()
+        if drawn != index:
+            draw_header(stdscr, "Relatorio")
+            visible = lines[index : index + (h - 5)]
+            addstr = stdscr.addstr
+            for y, line in enumerate(visible, start=3):
+                addstr(y, 2, line[: w - 4])
+            stdscr.addstr(h - 2, 2, "Setas: rolar  F6: exportar CSV  Q: voltar")
+            stdscr.noutrefresh()
+            curses.doupdate()
+            drawn = index
         key = stdscr.getch()
+        if key == curses.KEY_RESIZE:
+            drawn = None
+            continue
         if key in (ord("q"), ord("Q")):
             return
         if key == curses.KEY_F6:
@@ -1546,6 +2679,7 @@ def report_screen(stdscr):
                 default_path,
                 replace_on_type=True,
             )
+            drawn = None
             if not path:
                 continue
             headers = ["gerado_em", "modem", "total", "ok", "fail", "ultimo_ts"]
@@ -1572,14 +2706,24 @@ def report_screen(stdscr):
         elif key in (curses.KEY_DOWN, ord("j")):
             index = min(index + 1, max(len(lines) - 1, 0))
 
-def activate_modems(devices, commands, baud):
-    results = []
-    for dev in devices:
-        ok, resp = run_at_commands(dev, commands, baud=baud)
-        results.append((dev, ok, resp))
+def _run_at_on_devices(devices, commands, baud, tag, timeout=1.0):
+    # Portas seriais sao independentes: em paralelo, o total e o do modem mais
+    # lento. Resultados na ordem dos devices.
+    if not devices:
+        return []
+
+    def run(dev):
+        ok, resp = run_at_commands(dev, commands, baud=baud, timeout=timeout)
         status = "OK" if ok else "FAIL"
-        log_event(f"AT {status} {dev} | {resp}")
-    return results
+        log_event(f"{tag} {status} {dev} | {resp}")
+        return dev, ok, resp
+
+    with ThreadPoolExecutor(max_workers=min(8, len(devices))) as ex:
+        return list(ex.map(run, devices))
+
+
+def activate_modems(devices, commands, baud):
+    return _run_at_on_devices(devices, commands, baud, "AT")
 
 def activate_modems_screen(stdscr, cfg, devices):
     commands = parse_at_commands(cfg.get("init_at_commands", ""))
@@ -1617,13 +2761,10 @@ def activate_modems_screen(stdscr, cfg, devices):
     message_screen(stdscr, "Ativar modems", msg)
 
 def keepalive_modems(devices, commands, baud):
-    results = []
-    for dev in devices:
-        ok, resp = run_at_commands(dev, commands, baud=baud, timeout=0.5)
-        results.append((dev, ok, resp))
-        status = "OK" if ok else "FAIL"
-        log_event(f"KEEPALIVE {status} {dev} | {resp}")
-    return results
+    return _run_at_on_devices(devices, commands, baud, "KEEPALIVE", timeout=0.5)
+
+_AUTO_ACTIVATE_LAST = {"key": None}
+
 
 def auto_activate_devices(cfg, activated_real):
     if not cfg.get("auto_activate_on_start", False):
@@ -1631,7 +2772,13 @@ def auto_activate_devices(cfg, activated_real):
     commands = parse_at_commands(cfg.get("init_at_commands", ""))
     if not commands:
         return
-    detected = scan_devices()
+    # Mesmo /dev e mesmos comandos da ultima passada: nenhum device novo para
+    # ativar, nem precisa percorrer a lista (o loop e o tick chamam em seguida).
+    key = None if IS_WINDOWS else (_scan_signature(), tuple(commands), id(activated_real))
+    if key is not None and key == _AUTO_ACTIVATE_LAST["key"]:
+        return
+    detected = scan_devices_cached()
+    _AUTO_ACTIVATE_LAST["key"] = key
     if not detected:
         return
     current_real = {device_real(d) for d in detected}
@@ -1642,14 +2789,20 @@ def auto_activate_devices(cfg, activated_real):
     activate_modems(to_activate, commands, cfg.get("init_at_baud", 115200))
     activated_real.update({device_real(d) for d in to_activate})
 
-def keepalive_devices(cfg, last_ts):
+def _keepalive_interval(cfg):
     if not cfg.get("keepalive_enabled", False):
-        return last_ts
+        return None
     try:
         interval = float(cfg.get("keepalive_interval_sec", 60))
     except Exception:
         interval = 60.0
     if interval <= 0:
+        return None
+    return interval
+
+def keepalive_devices(cfg, last_ts):
+    interval = _keepalive_interval(cfg)
+    if interval is None:
         return last_ts
     now = time.monotonic()
     if last_ts and (now - last_ts) < interval:
@@ -1657,17 +2810,56 @@ def keepalive_devices(cfg, last_ts):
     commands = parse_at_commands(cfg.get("keepalive_commands", "AT"))
     if not commands:
         return now
-    detected = scan_devices()
+    detected = scan_devices_cached()
     if not detected:
         return now
     keepalive_modems(detected, commands, cfg.get("init_at_baud", 115200))
     return now
 
+def maintenance_pass(cfg, state):
+    # Auto ativacao e keepalive numa passada so, sobre o mesmo scan em cache
+    # (o segundo scan_devices_cached custa tres stat). state guarda o que
+    # sobrevive entre passadas; devolve o prazo da proxima (background_delay).
+    t0 = time.monotonic()
+    auto_activate_devices(cfg, state["activated_real"])
+    state["last_keepalive"] = keepalive_devices(cfg, state["last_keepalive"])
+    record_cost("tick", time.monotonic() - t0)
+    return background_delay(cfg, state["last_keepalive"])
+
+
+def background_delay(cfg, last_keepalive):
+    # Segundos ate a proxima tarefa de fundo do menu principal; None quando
+    # auto ativar e keepalive estao desligados (o menu so acorda com tecla).
+    delays = []
+    if cfg.get("auto_activate_on_start", False) and parse_at_commands(
+        cfg.get("init_at_commands", "")
+    ):
+        # Modem novo so aparece no proximo scan; o scan em cache e barato.
+        delays.append(paced_interval(AUTO_ACTIVATE_POLL_SEC, "tick"))
+    interval = _keepalive_interval(cfg)
+    if interval is not None:
+        delays.append(max(last_keepalive + interval - time.monotonic(), 0.0))
+    return min(delays) if delays else None
+
+
+@functools.lru_cache(maxsize=64)
+def _modem_label(idx):
+    # Mesmo objeto str para "Modem N" em todos os envios/redesenhos.
+    return f"Modem {idx}"
+
+
+_LAST_LABELS = [((), {})]
+
 
 def build_modem_labels(devices):
-    labels = {}
-    for idx, dev in enumerate(devices, start=1):
-        labels[dev] = f"Modem {idx}"
+    # Rescans e voltas ao menu repetem a mesma lista de devices; o dict de
+    # rotulos e so lido, entao o ultimo e reaproveitado. Uma tupla por slot
+    # para a thread de rescan nunca ver chave e rotulos de listas diferentes.
+    key = tuple(devices)
+    last_key, labels = _LAST_LABELS[0]
+    if key != last_key:
+        labels = {dev: _modem_label(idx) for idx, dev in enumerate(key, start=1)}
+        _LAST_LABELS[0] = (key, labels)
     return labels
 
 def compose_and_send(stdscr, cfg, devices):
@@ -1753,7 +2945,7 @@ def send_flow(stdscr, cfg, devices, recipients, message, flash):
 
     today = datetime.now().date()
     sent_today = set()
-    for rec in load_history():
+    for rec in iter_history():
         ts = parse_ts(rec.get("ts"))
         if not ts:
             continue
@@ -1788,7 +2980,7 @@ def send_flow(stdscr, cfg, devices, recipients, message, flash):
     dup_records = []
     for rec in duplicates_today:
         record = {
-            "ts": datetime.now().isoformat(timespec="seconds"),
+            "ts": _now_iso(),
             "name": _normalize_text(rec.get("name", "")),
             "number": rec.get("number", ""),
             "message": message,
@@ -1800,6 +2992,7 @@ def send_flow(stdscr, cfg, devices, recipients, message, flash):
         }
         append_history(record)
         dup_records.append(record)
+    flush_history()
 
     if not to_send:
         message_screen(
@@ -1823,322 +3016,405 @@ def send_flow(stdscr, cfg, devices, recipients, message, flash):
     attempt = 1
     pending = to_send
     total_ok = 0
-    status_list = ["PENDENTE" for _ in pending]
-    recipient_modems = ["-" for _ in pending]
+    status_list = ["PENDENTE"] * len(pending)
+    recipient_modems = ["-"] * len(pending)
     modem_order = list(selected)
     modem_labels = build_modem_labels(modem_order)
     modem_status = {dev: "-" for dev in modem_order}
     report_records = list(dup_records)
-    while True:
-        def progress_cb(
-            sent,
-            total,
-            ok_count,
-            fail_count,
-            current_num,
-            statuses,
-            current_idx,
-            current_modem,
-        ):
-            title = "Enviando" if attempt == 1 else f"Enviando (tentativa {attempt})"
-            draw_progress(
-                stdscr,
-                title,
+    # gammu-smsd segura as portas dos modems: para mesmo com erro ou Ctrl+C.
+    try:
+        if cfg.get("smsd_enabled", False):
+            start_smsd(sections, selected, cfg.get("connection", "at"))
+        while True:
+            def progress_cb(
                 sent,
                 total,
                 ok_count,
                 fail_count,
                 current_num,
-                recipients=pending,
-                status_list=statuses,
-                current_idx=current_idx,
-                current_modem=current_modem,
+                statuses,
+                current_idx,
+                current_modem,
+            ):
+                title = "Enviando" if attempt == 1 else f"Enviando (tentativa {attempt})"
+                draw_progress(
+                    stdscr,
+                    title,
+                    sent,
+                    total,
+                    ok_count,
+                    fail_count,
+                    current_num,
+                    recipients=pending,
+                    status_list=statuses,
+                    current_idx=current_idx,
+                    current_modem=current_modem,
+                    recipient_modems=recipient_modems,
+                    modem_status=modem_status,
+                    modem_order=modem_order,
+                    modem_labels=modem_labels,
+                    delay_info=delay_info,
+                )
+
+            ok_count, failed = send_numbers(
+                pending,
+                sections,
+                selected,
+                message,
+                flash,
+                delay,
+                random_delay_enabled=random_delay_enabled,
+                random_delay_min_sec=random_delay_min_sec,
+                random_delay_max_sec=random_delay_max_sec,
+                progress_cb=progress_cb,
+                status_list=status_list,
                 recipient_modems=recipient_modems,
                 modem_status=modem_status,
-                modem_order=modem_order,
                 modem_labels=modem_labels,
-                delay_info=delay_info,
+                report_records=report_records,
             )
+            total_ok += ok_count
+            fail_count = len(failed)
+            title = "Resultado" if attempt == 1 else f"Resultado (tentativa {attempt})"
+            report_lines, _ = build_report_from_records(report_records)
+            lines = [f"Enviados: {total_ok}", f"Falhas: {fail_count}", ""]
+            lines.extend(report_lines)
+            if fail_count == 0:
+                message_screen(stdscr, title, lines)
+                break
+            retry = retry_screen(stdscr, title, lines)
+            if not retry:
+                break
+            pending = [{"number": n, "name": ""} for n in failed]
+            attempt += 1
+            status_list = ["PENDENTE"] * len(pending)
+            recipient_modems = ["-"] * len(pending)
+    finally:
+        stop_smsd()
+
+
+def _yes_no(value):
+    return "sim" if value else "nao"
 
-        ok_count, failed = send_numbers(
-            pending,
-            sections,
-            selected,
-            message,
-            flash,
-            delay,
-            random_delay_enabled=random_delay_enabled,
-            random_delay_min_sec=random_delay_min_sec,
-            random_delay_max_sec=random_delay_max_sec,
-            progress_cb=progress_cb,
-            status_list=status_list,
-            recipient_modems=recipient_modems,
-            modem_status=modem_status,
-            modem_labels=modem_labels,
-            report_records=report_records,
+
+def _toggle_setting(key, default):
+    def handler(stdscr, cfg):
+        cfg[key] = not cfg.get(key, default)
+    return handler
+
+
+def _parse_float(text, default):
+    """Segundos digitados (aceita virgula decimal), nunca negativos."""
+    text = str(text or "").strip()
+    if not text:
+        return default
+    if "," in text:
+        text = text.replace(",", ".")
+    try:
+        return max(float(text), 0.0)
+    except ValueError:
+        return default
+
+
+def _edit_float_setting(key, title, prompt, default):
+    def handler(stdscr, cfg):
+        val = prompt_input(
+            stdscr,
+            title,
+            prompt,
+            str(cfg.get(key, default)),
+            replace_on_type=True,
         )
-        total_ok += ok_count
-        fail_count = len(failed)
-        title = "Resultado" if attempt == 1 else f"Resultado (tentativa {attempt})"
-        report_lines, _ = build_report_from_records(report_records)
-        if fail_count == 0:
-            message_screen(
-                stdscr,
-                title,
-                [f"Enviados: {total_ok}", "Falhas: 0", ""] + report_lines,
-            )
-            break
-        retry = retry_screen(
+        cfg[key] = _parse_float(val, cfg.get(key, float(default)))
+    return handler
+
+
+def _edit_text_setting(key, title, prompt, default, fallback, replace_on_type=True):
+    def handler(stdscr, cfg):
+        val = prompt_input(
             stdscr,
             title,
-            [f"Enviados: {total_ok}", f"Falhas: {fail_count}", ""] + report_lines,
+            prompt,
+            cfg.get(key, default),
+            replace_on_type=replace_on_type,
         )
-        if not retry:
-            break
-        pending = [{"number": n, "name": ""} for n in failed]
-        attempt += 1
-        status_list = ["PENDENTE" for _ in pending]
-        recipient_modems = ["-" for _ in pending]
+        cfg[key] = val or fallback
+    return handler
+
+
+def _edit_prefix(stdscr, cfg):
+    cfg["country_prefix"] = prompt_input(
+        stdscr,
+        "Prefixo",
+        "Digite o prefixo do pais (ex: 55) ou vazio:",
+        cfg.get("country_prefix", ""),
+    )
+
+
+def _edit_at_baud(stdscr, cfg):
+    val = prompt_input(
+        stdscr,
+        "Baud AT",
+        "Baud rate para comandos AT (ex: 115200):",
+        str(cfg.get("init_at_baud", 115200)),
+        replace_on_type=True,
+    )
+    try:
+        cfg["init_at_baud"] = max(int(str(val).strip()), 1200)
+    except Exception:
+        cfg["init_at_baud"] = cfg.get("init_at_baud", 115200)
+
+
+def _edit_ui_max_fps(stdscr, cfg):
+    val = prompt_input(
+        stdscr,
+        "FPS maximo",
+        "Quadros por segundo nos menus (ex: 30; menos em terminais lentos):",
+        str(cfg.get("ui_max_fps", UI_MAX_FPS_DEFAULT)),
+        replace_on_type=True,
+    )
+    current = cfg.get("ui_max_fps", UI_MAX_FPS_DEFAULT)
+    try:
+        fps = int(str(val).strip())
+    except ValueError:
+        fps = current
+    if fps <= 0:
+        fps = current
+    cfg["ui_max_fps"] = set_ui_max_fps(fps)
+
+
+# (rotulo, handler) por opcao do menu Config; o indice escolhido no menu e o
+# indice da tabela, e os rotulos saem da mesma lista.
+_SETTINGS_ITEMS = (
+    (
+        lambda cfg: f"Toggle flash (atual: {_yes_no(cfg.get('flash'))})",
+        _toggle_setting("flash", False),
+    ),
+    (
+        lambda cfg: f"Pais prefixo (atual: {cfg.get('country_prefix') or 'vazio'})",
+        _edit_prefix,
+    ),
+    (
+        lambda cfg: f"Connection (atual: {cfg.get('connection')})",
+        _edit_text_setting(
+            "connection",
+            "Connection",
+            "Digite o connection do Gammu (ex: at, at115200):",
+            "at",
+            "at",
+            replace_on_type=False,
+        ),
+    ),
+    (
+        lambda cfg: f"Delay entre envios (seg, atual: {cfg.get('send_delay_sec')})",
+        _edit_float_setting(
+            "send_delay_sec", "Delay", "Delay entre envios (segundos, ex: 0.5):", 0
+        ),
+    ),
+    (
+        lambda cfg: f"Delay aleatorio (atual: {_yes_no(cfg.get('random_delay_enabled'))})",
+        _toggle_setting("random_delay_enabled", False),
+    ),
+    (
+        lambda cfg: f"Delay aleatorio min (seg, atual: {cfg.get('random_delay_min_sec', 10)})",
+        _edit_float_setting(
+            "random_delay_min_sec", "Delay aleatorio min", "Minimo em segundos (ex: 10):", 10
+        ),
+    ),
+    (
+        lambda cfg: f"Delay aleatorio max (seg, atual: {cfg.get('random_delay_max_sec', 30)})",
+        _edit_float_setting(
+            "random_delay_max_sec", "Delay aleatorio max", "Maximo em segundos (ex: 30):", 30
+        ),
+    ),
+    (
+        lambda cfg: f"Validar modems (atual: {_yes_no(cfg.get('validate_modems'))})",
+        _toggle_setting("validate_modems", True),
+    ),
+    (
+        lambda cfg: f"Mostrar numero do chip (atual: {_yes_no(cfg.get('read_numbers'))})",
+        _toggle_setting("read_numbers", False),
+    ),
+    (
+        lambda cfg: f"Comandos AT (atual: {summarize_at_commands(cfg.get('init_at_commands'))})",
+        _edit_text_setting(
+            "init_at_commands",
+            "Comandos AT",
+            "Comandos AT separados por ';' (ex: AT+ZCDRUN=8) ou vazio:",
+            "",
+            "",
+        ),
+    ),
+    (
+        lambda cfg: f"Baud AT (atual: {cfg.get('init_at_baud', 115200)})",
+        _edit_at_baud,
+    ),
+    (
+        lambda cfg: f"Auto ativar AT (atual: {_yes_no(cfg.get('auto_activate_on_start', False))})",
+        _toggle_setting("auto_activate_on_start", False),
+    ),
+    (
+        lambda cfg: f"Keepalive AT (atual: {_yes_no(cfg.get('keepalive_enabled', False))})",
+        _toggle_setting("keepalive_enabled", False),
+    ),
+    (
+        lambda cfg: f"Keepalive intervalo (seg, atual: {cfg.get('keepalive_interval_sec', 60)})",
+        _edit_float_setting(
+            "keepalive_interval_sec",
+            "Keepalive intervalo",
+            "Intervalo em segundos (ex: 60) ou 0 para desativar:",
+            60,
+        ),
+    ),
+    (
+        lambda cfg: f"Keepalive comandos (atual: {summarize_at_commands(cfg.get('keepalive_commands'))})",
+        _edit_text_setting(
+            "keepalive_commands",
+            "Keepalive comandos",
+            "Comandos AT separados por ';' (ex: AT) ou vazio:",
+            "AT",
+            "",
+        ),
+    ),
+    (
+        lambda cfg: f"Usar gammu-smsd (atual: {_yes_no(cfg.get('smsd_enabled', False))})",
+        _toggle_setting("smsd_enabled", False),
+    ),
+    (
+        lambda cfg: f"FPS maximo da tela (atual: {cfg.get('ui_max_fps', UI_MAX_FPS_DEFAULT)})",
+        _edit_ui_max_fps,
+    ),
+)
 
 
 def settings_menu(stdscr, cfg):
+    # Cada ajuste so marca o cfg como alterado; grava uma vez ao sair do menu.
+    dirty = False
+    options = [label(cfg) for label, _ in _SETTINGS_ITEMS]
+    options.append("Voltar")
     while True:
-        options = [
-            f"Toggle flash (atual: {'sim' if cfg.get('flash') else 'nao'})",
-            f"Pais prefixo (atual: {cfg.get('country_prefix') or 'vazio'})",
-            f"Connection (atual: {cfg.get('connection')})",
-            f"Delay entre envios (seg, atual: {cfg.get('send_delay_sec')})",
-            f"Delay aleatorio (atual: {'sim' if cfg.get('random_delay_enabled') else 'nao'})",
-            f"Delay aleatorio min (seg, atual: {cfg.get('random_delay_min_sec', 10)})",
-            f"Delay aleatorio max (seg, atual: {cfg.get('random_delay_max_sec', 30)})",
-            f"Validar modems (atual: {'sim' if cfg.get('validate_modems') else 'nao'})",
-            f"Mostrar numero do chip (atual: {'sim' if cfg.get('read_numbers') else 'nao'})",
-            f"Comandos AT (atual: {summarize_at_commands(cfg.get('init_at_commands'))})",
-            f"Baud AT (atual: {cfg.get('init_at_baud', 115200)})",
-            f"Auto ativar AT (atual: {'sim' if cfg.get('auto_activate_on_start', False) else 'nao'})",
-            f"Keepalive AT (atual: {'sim' if cfg.get('keepalive_enabled', False) else 'nao'})",
-            f"Keepalive intervalo (seg, atual: {cfg.get('keepalive_interval_sec', 60)})",
-            f"Keepalive comandos (atual: {summarize_at_commands(cfg.get('keepalive_commands'))})",
-            "Voltar",
-        ]
         choice = menu(stdscr, "Config", options)
-        if choice is None or choice == 15:
+        if choice is None or choice >= len(_SETTINGS_ITEMS):
+            if dirty:
+                save_config(cfg)
             return
-        if choice == 0:
-            cfg["flash"] = not cfg.get("flash", False)
-            save_config(cfg)
-        elif choice == 1:
-            val = prompt_input(
-                stdscr,
-                "Prefixo",
-                "Digite o prefixo do pais (ex: 55) ou vazio:",
-                cfg.get("country_prefix", ""),
-            )
-            cfg["country_prefix"] = val
-            save_config(cfg)
-        elif choice == 2:
-            val = prompt_input(
-                stdscr,
-                "Connection",
-                "Digite o connection do Gammu (ex: at, at115200):",
-                cfg.get("connection", "at"),
-            )
-            cfg["connection"] = val or "at"
-            save_config(cfg)
-        elif choice == 3:
-            val = prompt_input(
-                stdscr,
-                "Delay",
-                "Delay entre envios (segundos, ex: 0.5):",
-                str(cfg.get("send_delay_sec", 0)),
-                replace_on_type=True,
-            )
-            try:
-                cfg["send_delay_sec"] = max(float(val.replace(",", ".")), 0.0)
-            except Exception:
-                cfg["send_delay_sec"] = cfg.get("send_delay_sec", 0.0)
-            save_config(cfg)
-        elif choice == 4:
-            cfg["random_delay_enabled"] = not cfg.get("random_delay_enabled", False)
-            save_config(cfg)
-        elif choice == 5:
-            val = prompt_input(
-                stdscr,
-                "Delay aleatorio min",
-                "Minimo em segundos (ex: 10):",
-                str(cfg.get("random_delay_min_sec", 10)),
-                replace_on_type=True,
-            )
-            try:
-                cfg["random_delay_min_sec"] = max(float(val.replace(",", ".")), 0.0)
-            except Exception:
-                cfg["random_delay_min_sec"] = cfg.get("random_delay_min_sec", 10.0)
-            save_config(cfg)
-        elif choice == 6:
-            val = prompt_input(
-                stdscr,
-                "Delay aleatorio max",
-                "Maximo em segundos (ex: 30):",
-                str(cfg.get("random_delay_max_sec", 30)),
-                replace_on_type=True,
-            )
-            try:
-                cfg["random_delay_max_sec"] = max(float(val.replace(",", ".")), 0.0)
-            except Exception:
-                cfg["random_delay_max_sec"] = cfg.get("random_delay_max_sec", 30.0)
-            save_config(cfg)
-        elif choice == 7:
-            cfg["validate_modems"] = not cfg.get("validate_modems", True)
-            save_config(cfg)
-        elif choice == 8:
-            cfg["read_numbers"] = not cfg.get("read_numbers", False)
-            save_config(cfg)
-        elif choice == 9:
-            val = prompt_input(
-                stdscr,
-                "Comandos AT",
-                "Comandos AT separados por ';' (ex: AT+ZCDRUN=8) ou vazio:",
-                cfg.get("init_at_commands", ""),
-                replace_on_type=True,
-            )
-            cfg["init_at_commands"] = val or ""
-            save_config(cfg)
-        elif choice == 10:
-            val = prompt_input(
-                stdscr,
-                "Baud AT",
-                "Baud rate para comandos AT (ex: 115200):",
-                str(cfg.get("init_at_baud", 115200)),
-                replace_on_type=True,
-            )
-            try:
-                cfg["init_at_baud"] = max(int(str(val).strip()), 1200)
-            except Exception:
-                cfg["init_at_baud"] = cfg.get("init_at_baud", 115200)
-            save_config(cfg)
-        elif choice == 11:
-            cfg["auto_activate_on_start"] = not cfg.get("auto_activate_on_start", False)
-            save_config(cfg)
-        elif choice == 12:
-            cfg["keepalive_enabled"] = not cfg.get("keepalive_enabled", False)
-            save_config(cfg)
-        elif choice == 13:
-            val = prompt_input(
-                stdscr,
-                "Keepalive intervalo",
-                "Intervalo em segundos (ex: 60) ou 0 para desativar:",
-                str(cfg.get("keepalive_interval_sec", 60)),
-                replace_on_type=True,
-            )
-            try:
-                cfg["keepalive_interval_sec"] = max(float(val.replace(",", ".")), 0.0)
-            except Exception:
-                cfg["keepalive_interval_sec"] = cfg.get("keepalive_interval_sec", 60)
-            save_config(cfg)
-        elif choice == 14:
-            val = prompt_input(
-                stdscr,
-                "Keepalive comandos",
-                "Comandos AT separados por ';' (ex: AT) ou vazio:",
-                cfg.get("keepalive_commands", "AT"),
-                replace_on_type=True,
+        label, handler = _SETTINGS_ITEMS[choice]
+        handler(stdscr, cfg)
+        dirty = True
+        # So a opcao alterada precisa de rotulo novo.
+        options[choice] = label(cfg)
+
+def _select_modems(stdscr, cfg, session):
+    devices = session["devices"]
+    status_map = session["status"]
+    number_map = session["numbers"]
+    labels_map = session["labels"]
+    selected_cfg = cfg.get("selected_devices", [])
+    selected = resolve_selected_devices(devices, selected_cfg)
+    checked = set(selected)
+    connection, validate, read_numbers, prefer = session["scan_opts"]
+    while True:
+        def do_rescan():
+            auto_activate_devices(cfg, session["maintenance"]["activated_real"])
+            items, status, numbers = scan_devices_with_status(
+                connection, validate, read_numbers, prefer_devices=list(prefer)
             )
-            cfg["keepalive_commands"] = val or ""
-            save_config(cfg)
+            labels = build_modem_labels(items)
+            return items, status, numbers, labels
+
+        result = checkbox_list(
+            stdscr,
+            "Modems",
+            devices,
+            checked,
+            status_map,
+            number_map,
+            labels=labels_map,
+            rescan_fn=do_rescan,
+            rescan_interval_sec=int(paced_interval(30, "probe")),
+        )
+        if result == "__RESCAN__":
+            devices, status_map, number_map, labels_map = do_rescan()
+            continue
+        checked = result
+        break
+    cfg["selected_devices"] = sorted(checked)
+    save_config(cfg)
+
+
+_MAIN_TITLE = f"Europa CLI - Sender SMS ({VERSION})"
+_MAIN_OPTIONS = (
+    "Selecionar modems",
+    "Compor e enviar",
+    "Reenviar do historico",
+    "Historico",
+    "Relatorio",
+    "Ativar modems (AT)",
+    "Liberar portas (kill)",
+    "Configuracoes",
+    "Ver log",
+    "Ajuda",
+    "Sair",
+)
+# (handler, refazer o scan na volta, pode alterar o cfg) por opcao, na ordem
+# de _MAIN_OPTIONS; qualquer indice alem da tabela e "Sair".
+_MAIN_ACTIONS = (
+    (_select_modems, True, True),
+    (lambda stdscr, cfg, session: compose_and_send(stdscr, cfg, session["devices"]), False, False),
+    (lambda stdscr, cfg, session: resend_from_history(stdscr, cfg, session["devices"]), False, False),
+    (lambda stdscr, cfg, session: history_screen(stdscr), False, False),
+    (lambda stdscr, cfg, session: report_screen(stdscr), False, False),
+    (lambda stdscr, cfg, session: activate_modems_screen(stdscr, cfg, session["devices"]), True, False),
+    (lambda stdscr, cfg, session: release_ports_screen(stdscr, cfg, session["devices"]), True, False),
+    (lambda stdscr, cfg, session: settings_menu(stdscr, cfg), False, True),
+    (lambda stdscr, cfg, session: view_log(stdscr), False, False),
+    (lambda stdscr, cfg, session: help_screen(stdscr), False, False),
+)
 
 
 def main(stdscr):
+    import locale
+
     locale.setlocale(locale.LC_ALL, "")
     curses.use_default_colors()
+    # Resolve (e persiste) o gammu antes de carregar o cfg usado pela sessao,
+    # senao o proximo save_config(cfg) apagaria o gammu_bin_path salvo.
+    gammu_bin()
     cfg = load_config()
-    auto_activated_real = set()
-    last_keepalive = 0.0
+    set_ui_max_fps(cfg.get("ui_max_fps", UI_MAX_FPS_DEFAULT))
+    maintenance = {"activated_real": set(), "last_keepalive": 0.0}
+    # Opcoes de scan lidas do cfg uma vez; so acoes que podem altera-lo
+    # (selecao de modems, Config) pedem uma nova leitura.
+    session = {"maintenance": maintenance, "scan_opts": scan_options(cfg)}
 
     while True:
-        auto_activate_devices(cfg, auto_activated_real)
-        last_keepalive = keepalive_devices(cfg, last_keepalive)
-        devices, status_map, number_map = scan_devices_with_status(
-            cfg.get("connection", "at"),
-            cfg.get("validate_modems", True),
-            cfg.get("read_numbers", False),
-            prefer_devices=cfg.get("selected_devices", []),
+        maintenance_pass(cfg, maintenance)
+        devices, status_map, number_map = scan_devices_for_menu(session["scan_opts"])
+        session.update(
+            devices=devices,
+            status=status_map,
+            numbers=number_map,
+            labels=build_modem_labels(devices),
         )
-        labels_map = build_modem_labels(devices)
-        options = [
-            "Selecionar modems",
-            "Compor e enviar",
-            "Reenviar do historico",
-            "Historico",
-            "Relatorio",
-            "Ativar modems (AT)",
-            "Liberar portas (kill)",
-            "Configuracoes",
-            "Ver log",
-            "Ajuda",
-            "Sair",
-        ]
-        title = f"Europa CLI - Sender SMS ({VERSION})"
-        def tick():
-            nonlocal last_keepalive
-            auto_activate_devices(cfg, auto_activated_real)
-            last_keepalive = keepalive_devices(cfg, last_keepalive)
-
-        choice = menu(stdscr, title, options, tick_fn=tick, tick_interval_sec=1)
-        if choice is None or choice == 10:
+        choice = menu(
+            stdscr,
+            _MAIN_TITLE,
+            _MAIN_OPTIONS,
+            tick_fn=lambda: maintenance_pass(cfg, maintenance),
+            tick_delay_sec=background_delay(cfg, maintenance["last_keepalive"]),
+        )
+        if choice is None or choice >= len(_MAIN_ACTIONS):
             break
-        if choice == 0:
-            selected_cfg = cfg.get("selected_devices", [])
-            selected = resolve_selected_devices(devices, selected_cfg)
-            checked = set(selected)
-            while True:
-                def do_rescan():
-                    auto_activate_devices(cfg, auto_activated_real)
-                    items, status, numbers = scan_devices_with_status(
-                        cfg.get("connection", "at"),
-                        cfg.get("validate_modems", True),
-                        cfg.get("read_numbers", False),
-                        prefer_devices=cfg.get("selected_devices", []),
-                    )
-                    labels = build_modem_labels(items)
-                    return items, status, numbers, labels
-
-                result = checkbox_list(
-                    stdscr,
-                    "Modems",
-                    devices,
-                    checked,
-                    status_map,
-                    number_map,
-                    labels=labels_map,
-                    rescan_fn=do_rescan,
-                    rescan_interval_sec=30,
-                )
-                if result == "__RESCAN__":
-                    devices, status_map, number_map, labels_map = do_rescan()
-                    continue
-                checked = result
-                break
-            cfg["selected_devices"] = sorted(checked)
-            save_config(cfg)
-        elif choice == 1:
-            compose_and_send(stdscr, cfg, devices)
-        elif choice == 2:
-            resend_from_history(stdscr, cfg, devices)
-        elif choice == 3:
-            history_screen(stdscr)
-        elif choice == 4:
-            report_screen(stdscr)
-        elif choice == 5:
-            activate_modems_screen(stdscr, cfg, devices)
-        elif choice == 6:
-            release_ports_screen(stdscr, cfg, devices)
-        elif choice == 7:
-            settings_menu(stdscr, cfg)
-        elif choice == 8:
-            view_log(stdscr)
-        elif choice == 9:
-            help_screen(stdscr)
-
+        action, rescan_after, edits_cfg = _MAIN_ACTIONS[choice]
+        action(stdscr, cfg, session)
+        if edits_cfg:
+            session["scan_opts"] = scan_options(cfg)
+        if rescan_after:
+            invalidate_menu_scan()
 
 if __name__ == "__main__":
+    if curses is None:
+        print("Erro: curses nao disponivel. No Windows, instale: pip install windows-curses")
+        raise SystemExit(1)
     curses.wrapper(main)